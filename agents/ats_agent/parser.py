@@ -2,11 +2,15 @@
 CV Parser Module - Extract text and basic info from PDF/DOCX files
 """
 import re
+import logging
 from typing import Dict, Optional
 import pdfplumber
 from docx import Document
 
 
+log = logging.getLogger(__name__)
+
+
 def extract_text_from_pdf(file_path: str) -> str:
     """Extract text from PDF file."""
     try:
@@ -18,7 +22,7 @@ def extract_text_from_pdf(file_path: str) -> str:
                     text += page_text + "\n"
         return text.strip()
     except Exception as e:
-        print(f"Error extracting PDF text: {e}")
+        log.error("Error extracting PDF text: %s", e)
         return ""
 
 
@@ -29,7 +33,7 @@ def extract_text_from_docx(file_path: str) -> str:
         text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
         return text.strip()
     except Exception as e:
-        print(f"Error extracting DOCX text: {e}")
+        log.error("Error extracting DOCX text: %s", e)
         return ""
 
 
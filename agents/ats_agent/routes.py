@@ -2,21 +2,78 @@
 ATS Agent Routes - Flask endpoints for dashboard, config, and scanning
 """
 import os
+import base64
+import logging
+from io import BytesIO
 from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, abort
+import requests
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, abort, Response
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from sqlalchemy.orm import load_only, undefer_group
 
 from . import ats_bp
-from models import db, ATSAgentConfig, CVCandidate, ATSScanHistory, ActivityLog
+from models import db, CVCandidate, ATSScanHistory, ActivityLog
+from utils.ms_auth import get_valid_access_token
+from utils.request_cache import get_ats_config, get_user_settings
 from .parser import extract_text_from_cv, parse_cv_basic_info
 from .filters import apply_hard_filters
 from .scorer import score_cv_with_openai, calculate_weighted_score
 from .scanner import scan_outlook_folder, scan_sharepoint_library, download_file, save_base64_file
+from .stats import get_dashboard_stats, invalidate_dashboard_stats
 
 
+log = logging.getLogger(__name__)
+
 UPLOAD_FOLDER = 'static/uploads/cvs'
-ALLOWED_EXTENSIONS = {' pdf', 'docx', 'doc'}
+ALLOWED_EXTENSIONS = frozenset(('pdf', 'docx', 'doc'))
+
+
+def csv_list(value):
+    """Split a comma-separated form value into a list of trimmed, non-empty items."""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+# Config form fields: (name, cast, default). A cast of None stores the raw value.
+CONFIG_FORM_FIELDS = [
+    # Job Details
+    ('job_title', None, None),
+    ('job_description', None, None),
+    ('required_skills', csv_list, ''),
+    
+    # Filters
+    ('allowed_locations', csv_list, ''),
+    ('min_experience', int, 0),
+    ('max_experience', int, 99),
+    ('min_education_level', None, None),
+    ('must_have_skills', csv_list, ''),
+    
+    # Scoring Weights
+    ('weight_skills', float, 0.4),
+    ('weight_title', float, 0.2),
+    ('weight_experience', float, 0.2),
+    ('weight_education', float, 0.1),
+    ('weight_keywords', float, 0.1),
+    
+    # CV Sources
+    ('onedrive_folder_path', None, 'CVs'),
+    ('email_folder_name', None, 'Recruitment'),
+    ('sharepoint_site_url', None, None),
+    ('sharepoint_library', None, None),
+    
+    # Output Config
+    ('top_n_candidates', int, 10),
+    ('min_threshold_score', int, 60),
+]
+
+# Checkbox fields: True when present in the submitted form
+CONFIG_CHECKBOX_FIELDS = (
+    'onedrive_enabled',
+    'email_folder_enabled',
+    'email_inbox_enabled',
+    'sharepoint_enabled',
+    'is_enabled',
+)
 
 
 def allowed_file(filename):
@@ -26,95 +83,87 @@ def allowed_file(filename):
 @ats_bp.route('/dashboard')
 @login_required
 def dashboard():
-    """ATS Agent Dashboard."""
+    """ATS Agent Dashboard (widgets are loaded over AJAX)."""
     # Get or create config
-    config = ATSAgentConfig.query.filter_by(user_id=current_user.id).first()
-    if not config:
-        config = ATSAgentConfig(user_id=current_user.id)
-        db.session.add(config)
-        db.session.commit()
-    
-    # Get statistics
-    total_cvs = CVCandidate.query.filter_by(user_id=current_user.id).count()
-    scored_cvs = CVCandidate.query.filter_by(user_id=current_user.id, status='scored').count()
-    filtered_cvs = CVCandidate.query.filter_by(user_id=current_user.id, status='filtered_out').count()
+    config = get_ats_config(create=True)
     
-    # Get average score
-    scored_candidates = CVCandidate.query.filter_by(user_id=current_user.id, status='scored').all()
-    avg_score = 0
-    if scored_candidates:
-        avg_score = sum(float(c.final_weighted_score or 0) for c in scored_candidates) / len(scored_candidates)
-    
-    # Get top candidates
-    top_candidates = CVCandidate.query.filter_by(user_id=current_user.id, status='scored')\
-        .order_by(CVCandidate.final_weighted_score.desc())\
-        .limit(config.top_n_candidates).all()
-    
-    # Get recent scans
+    return render_template('ats/dashboard.html', config=config)
+
+
+@ats_bp.route('/dashboard/stats.json')
+@login_required
+def dashboard_stats():
+    """Dashboard widget: CV statistics."""
+    # Cached per user, invalidated when a scan writes results
+    total_cvs, scored_cvs, filtered_cvs, avg_score, _ = get_dashboard_stats(current_user.id)
+    
+    return jsonify({
+        'total_cvs': total_cvs,
+        'scored_cvs': scored_cvs,
+        'filtered_cvs': filtered_cvs,
+        'avg_score': avg_score
+    })
+
+
+@ats_bp.route('/dashboard/top.json')
+@login_required
+def dashboard_top():
+    """Dashboard widget: top scored candidates."""
+    _, _, _, _, top_ids = get_dashboard_stats(current_user.id)
+    
+    top_candidates = []
+    if top_ids:
+        by_id = {c.id: c for c in CVCandidate.query.filter(CVCandidate.id.in_(top_ids)).all()}
+        top_candidates = [by_id[i] for i in top_ids if i in by_id]
+    
+    return jsonify({
+        'candidates': [{
+            'id': c.id,
+            'full_name': c.full_name,
+            'email': c.email,
+            'final_weighted_score': float(c.final_weighted_score or 0),
+            'years_of_experience': float(c.years_of_experience) if c.years_of_experience is not None else None,
+            'location': c.location,
+            'url': url_for('ats.candidate_detail', candidate_id=c.id)
+        } for c in top_candidates]
+    })
+
+
+@ats_bp.route('/dashboard/recent.json')
+@login_required
+def dashboard_recent():
+    """Dashboard widget: recent scans."""
     recent_scans = ATSScanHistory.query.filter_by(user_id=current_user.id)\
         .order_by(ATSScanHistory.scan_started_at.desc())\
         .limit(5).all()
     
-    return render_template('ats/dashboard.html',
-                         config=config,
-                         total_cvs=total_cvs,
-                         scored_cvs=scored_cvs,
-                         filtered_cvs=filtered_cvs,
-                         avg_score=round(avg_score, 1),
-                         top_candidates=top_candidates,
-                         recent_scans=recent_scans)
+    return jsonify({
+        'scans': [{
+            'id': scan.id,
+            'status': scan.status,
+            'cvs_scored': scan.cvs_scored or 0,
+            'cvs_filtered_out': scan.cvs_filtered_out or 0,
+            'scan_started_at': scan.scan_started_at.strftime('%b %d, %H:%M') if scan.scan_started_at else ''
+        } for scan in recent_scans]
+    })
 
 
 @ats_bp.route('/config', methods=['GET', 'POST'])
 @login_required
 def config():
     """ATS Agent Configuration."""
-    ats_config = ATSAgentConfig.query.filter_by(user_id=current_user.id).first()
-    if not ats_config:
-        ats_config = ATSAgentConfig(user_id=current_user.id)
-        db.session.add(ats_config)
-        db.session.commit()
+    ats_config = get_ats_config(create=True)
     
     if request.method == 'POST':
-        # Job Details
-        ats_config.job_title = request.form.get('job_title')
-        ats_config.job_description = request.form.get('job_description')
-        required_skills = request.form.get('required_skills', '').split(',')
-        ats_config.required_skills = [s.strip() for s in required_skills if s.strip()]
-        
-        # Filters
-        allowed_locs = request.form.get('allowed_locations', '').split(',')
-        ats_config.allowed_locations = [l.strip() for l in allowed_locs if l.strip()]
-        ats_config.min_experience = int(request.form.get('min_experience', 0))
-        ats_config.max_experience = int(request.form.get('max_experience', 99))
-        ats_config.min_education_level = request.form.get('min_education_level')
-        must_have = request.form.get('must_have_skills', '').split(',')
-        ats_config.must_have_skills = [s.strip() for s in must_have if s.strip()]
-        
-        # Scoring Weights
-        ats_config.weight_skills = float(request.form.get('weight_skills', 0.4))
-        ats_config.weight_title = float(request.form.get('weight_title', 0.2))
-        ats_config.weight_experience = float(request.form.get('weight_experience', 0.2))
-        ats_config.weight_education = float(request.form.get('weight_education', 0.1))
-        ats_config.weight_keywords = float(request.form.get('weight_keywords', 0.1))
-        
-        # CV Sources
-        ats_config.onedrive_enabled = 'onedrive_enabled' in request.form
-        ats_config.onedrive_folder_path = request.form.get('onedrive_folder_path', 'CVs')
-        ats_config.email_folder_enabled = 'email_folder_enabled' in request.form
-        ats_config.email_folder_name = request.form.get('email_folder_name', 'Recruitment')
-        ats_config.email_inbox_enabled = 'email_inbox_enabled' in request.form
-        ats_config.sharepoint_enabled = 'sharepoint_enabled' in request.form
-        ats_config.sharepoint_site_url = request.form.get('sharepoint_site_url')
-        ats_config.sharepoint_library = request.form.get('sharepoint_library')
+        for field, cast, default in CONFIG_FORM_FIELDS:
+            value = request.form.get(field, default)
+            setattr(ats_config, field, cast(value) if cast else value)
         
-        # Output Config
-        ats_config.top_n_candidates = int(request.form.get('top_n_candidates', 10))
-        ats_config.min_threshold_score = int(request.form.get('min_threshold_score', 60))
-        
-        ats_config.is_enabled = 'is_enabled' in request.form
+        for field in CONFIG_CHECKBOX_FIELDS:
+            setattr(ats_config, field, field in request.form)
         
         db.session.commit()
+        invalidate_dashboard_stats(current_user.id)
         flash('ATS configuration saved successfully!', 'success')
         return redirect(url_for('ats.dashboard'))
     
@@ -135,13 +184,12 @@ def run_ajax():
     """AJAX endpoint to trigger CV scan (runs in background via Celery)."""
     try:
         # Get config
-        config = ATSAgentConfig.query.filter_by(user_id=current_user.id).first()
+        config = get_ats_config()
         if not config or not config.is_enabled:
             return jsonify({'success': False, 'error': 'ATS agent not configured or disabled'})
         
         # Get OpenAI API key
-        from models import UserSettings
-        settings = UserSettings.query.filter_by(user_id=current_user.id).first()
+        settings = get_user_settings()
         if not settings or not settings.openai_api_key:
             return jsonify({'success': False, 'error': 'OpenAI API key not configured'})
         
@@ -149,31 +197,47 @@ def run_ajax():
         if not settings.ms_access_token:
             return jsonify({'success': False, 'error': 'Microsoft account not connected'})
         
-        # Trigger background Celery task instead of running synchronously
-        from agents.ats_agent.tasks import process_ats_scan
-        process_ats_scan.delay(current_user.id)  # Run in background via Celery
+        # Create the scan record up front so the frontend can poll its status
+        scan = ATSScanHistory(user_id=current_user.id, status='running')
+        db.session.add(scan)
         
         # Log activity
-        log = ActivityLog(
+        activity_log = ActivityLog(
             user_id=current_user.id,
             agent_type='ats',
             action='scan_triggered',
             message='ATS scan started (running in background)',
             status='success'
         )
-        db.session.add(log)
+        db.session.add(activity_log)
         db.session.commit()
         
+        # Trigger background Celery task instead of running synchronously
+        # (imported here: tasks -> celery_worker -> agents.ats_agent.tasks is circular)
+        from agents.ats_agent.tasks import process_ats_scan
+        try:
+            process_ats_scan.delay(current_user.id, scan.id)  # Run in background via Celery
+        except Exception as e:
+            # Broker unavailable - don't leave the scan 'running' forever
+            scan.status = 'failed'
+            scan.error_message = f"Could not queue scan: {e}"[:500]
+            scan.scan_completed_at = datetime.utcnow()
+            activity_log.message = 'ATS scan could not be started'
+            activity_log.status = 'error'
+            db.session.commit()
+            log.exception("Error queueing ATS scan %s: %s", scan.id, e)
+            return jsonify({'success': False, 'error': str(e)})
+
         return jsonify({
             'success': True,
+            'scan_id': scan.id,
+            'history_url': url_for('ats.history'),
             'message': 'Scan started! Refresh the page in a few moments to see results.',
             'info': 'The scan is running in the background and may take 1-2 minutes depending on the number of CVs found.'
         })
         
     except Exception as e:
-        print(f"Error triggering ATS scan: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error triggering ATS scan: %s", e)
         return jsonify({'success': False, 'error': str(e)})
 
 
@@ -181,8 +245,18 @@ def run_ajax():
 @login_required
 def results():
     """View all candidates."""
+    page = request.args.get('page', 1, type=int)
+    per_page = 50
+    
+    # Only load the columns the list shows; full rows are fetched on the detail page
     candidates = CVCandidate.query.filter_by(user_id=current_user.id, status='scored')\
-        .order_by(CVCandidate.final_weighted_score.desc()).all()
+        .options(load_only(
+            CVCandidate.full_name, CVCandidate.email, CVCandidate.final_weighted_score,
+            CVCandidate.years_of_experience, CVCandidate._skills, CVCandidate.location,
+            CVCandidate.cv_source
+        ))\
+        .order_by(CVCandidate.final_weighted_score.desc())\
+        .paginate(page=page, per_page=per_page, error_out=False)
     
     return render_template('ats/results.html', candidates=candidates)
 
@@ -191,7 +265,8 @@ def results():
 @login_required
 def candidate_detail(candidate_id):
     """View detailed candidate profile."""
-    candidate = CVCandidate.query.filter_by(id=candidate_id, user_id=current_user.id).first_or_404()
+    candidate = CVCandidate.query.filter_by(id=candidate_id, user_id=current_user.id)\
+        .options(undefer_group('detail')).first_or_404()
     return render_template('ats/candidate.html', candidate=candidate)
 
 
@@ -207,17 +282,14 @@ def history():
 
 def _fetch_cv_from_source(candidate, access_token):
     """Fetch CV file from original source (OneDrive, Email, SharePoint)."""
-    import requests
-    import base64
-    from io import BytesIO
     
     source = candidate.cv_source
     source_id = candidate.source_file_id
     
-    print(f"[CV Fetch] Source: {source}, Source ID: {source_id[:50] if source_id else None}...")
+    log.debug("[CV Fetch] Source: %s, Source ID: %s...", source, source_id[:50] if source_id else None)
     
     if not source_id or not access_token:
-        print(f"[CV Fetch] Missing source_id or access_token")
+        log.warning("[CV Fetch] Missing source_id or access_token")
         return None, None
     
     headers = {'Authorization': f'Bearer {access_token}'}
@@ -234,17 +306,17 @@ def _fetch_cv_from_source(candidate, access_token):
                 # Fallback: split on last underscore
                 parts = source_id.rsplit('_', 1)
                 if len(parts) != 2:
-                    print(f"[CV Fetch] Cannot parse email source_id")
+                    log.warning("[CV Fetch] Cannot parse email source_id")
                     return None, None
                 message_id, attachment_id = parts
             
-            print(f"[CV Fetch] Email - Message ID: {message_id[:30]}..., Attachment ID: {attachment_id[:30]}...")
+            log.debug("[CV Fetch] Email - Message ID: %s..., Attachment ID: %s...", message_id[:30], attachment_id[:30])
             
             # Fetch attachment from Graph API
             url = f"https://graph.microsoft.com/v1.0/me/messages/{message_id}/attachments/{attachment_id}"
             response = requests.get(url, headers=headers)
             
-            print(f"[CV Fetch] Response: {response.status_code}")
+            log.debug("[CV Fetch] Response: %s", response.status_code)
             
             if response.status_code == 200:
                 data = response.json()
@@ -252,19 +324,19 @@ def _fetch_cv_from_source(candidate, access_token):
                 if content_bytes:
                     return BytesIO(base64.b64decode(content_bytes)), data.get('name')
             else:
-                print(f"[CV Fetch] Error: {response.text[:200]}")
+                log.warning("[CV Fetch] Error: %s", response.text[:200])
         
         elif source == 'onedrive':
             url = f"https://graph.microsoft.com/v1.0/me/drive/items/{source_id}/content"
-            print(f"[CV Fetch] OneDrive URL: {url}")
+            log.debug("[CV Fetch] OneDrive URL: %s", url)
             response = requests.get(url, headers=headers, allow_redirects=True)
             
-            print(f"[CV Fetch] Response: {response.status_code}")
+            log.debug("[CV Fetch] Response: %s", response.status_code)
             
             if response.status_code == 200:
                 return BytesIO(response.content), candidate.source_file_name
             else:
-                print(f"[CV Fetch] Error: {response.text[:200]}")
+                log.warning("[CV Fetch] Error: %s", response.text[:200])
         
         elif source == 'sharepoint':
             if ':' in source_id:
@@ -273,20 +345,20 @@ def _fetch_cv_from_source(candidate, access_token):
             else:
                 url = f"https://graph.microsoft.com/v1.0/me/drive/items/{source_id}/content"
             
-            print(f"[CV Fetch] SharePoint URL: {url}")
+            log.debug("[CV Fetch] SharePoint URL: %s", url)
             response = requests.get(url, headers=headers, allow_redirects=True)
             
-            print(f"[CV Fetch] Response: {response.status_code}")
+            log.debug("[CV Fetch] Response: %s", response.status_code)
             
             if response.status_code == 200:
                 return BytesIO(response.content), candidate.source_file_name
             else:
-                print(f"[CV Fetch] Error: {response.text[:200]}")
+                log.warning("[CV Fetch] Error: %s", response.text[:200])
         else:
-            print(f"[CV Fetch] Unknown source type: {source}")
+            log.warning("[CV Fetch] Unknown source type: %s", source)
     
     except Exception as e:
-        print(f"[CV Fetch] Exception: {e}")
+        log.warning("[CV Fetch] Exception: %s", e)
     
     return None, None
 
@@ -298,9 +370,6 @@ def _fetch_cv_from_source(candidate, access_token):
 @login_required
 def view_cv(candidate_id):
     """View the original CV file (fetches from source dynamically)."""
-    from flask import Response
-    from utils.ms_auth import get_valid_access_token
-    from models import UserSettings
     
     candidate = CVCandidate.query.get_or_404(candidate_id)
     
@@ -309,7 +378,7 @@ def view_cv(candidate_id):
         abort(403)
     
     # Get access token
-    settings = UserSettings.query.filter_by(user_id=current_user.id).first()
+    settings = get_user_settings()
     if not settings:
         flash('Microsoft account not connected', 'error')
         return redirect(url_for('ats.candidate_detail', candidate_id=candidate_id))
@@ -347,9 +416,6 @@ def view_cv(candidate_id):
 @login_required
 def download_cv(candidate_id):
     """Download the original CV file (fetches from source dynamically)."""
-    from flask import Response
-    from utils.ms_auth import get_valid_access_token
-    from models import UserSettings
     
     candidate = CVCandidate.query.get_or_404(candidate_id)
     
@@ -358,7 +424,7 @@ def download_cv(candidate_id):
         abort(403)
     
     # Get access token
-    settings = UserSettings.query.filter_by(user_id=current_user.id).first()
+    settings = get_user_settings()
     if not settings:
         flash('Microsoft account not connected', 'error')
         return redirect(url_for('ats.candidate_detail', candidate_id=candidate_id))
@@ -2,11 +2,26 @@
 CV Scanner Module - Collect CVs from multiple sources
 """
 import os
+import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 
 
+log = logging.getLogger(__name__)
+
+# Shared HTTP session: keeps connections to Graph alive across calls (no TLS
+# handshake per request) and retries transient failures
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+))
+
+
 def scan_outlook_folder(access_token: str, folder_name: str = "Recruitment") -> List[Dict]:
     """
     Scan Outlook folder for CV attachments using Microsoft Graph API.
@@ -17,7 +32,7 @@ def scan_outlook_folder(access_token: str, folder_name: str = "Recruitment") ->
         
         # Get folder ID
         folders_url = 'https://graph.microsoft.com/v1.0/me/mailFolders'
-        response = requests.get(folders_url, headers=headers)
+        response = _session.get(folders_url, headers=headers)
         response.raise_for_status()
         folders = response.json().get('value', [])
         
@@ -28,12 +43,12 @@ def scan_outlook_folder(access_token: str, folder_name: str = "Recruitment") ->
                 break
         
         if not folder_id:
-            print(f"Folder '{folder_name}' not found")
+            log.warning("Folder '%s' not found", folder_name)
             return []
         
         # Get newest messages first (no filter to avoid API error, check hasAttachments in code)
         messages_url = f'https://graph.microsoft.com/v1.0/me/mailFolders/{folder_id}/messages?$orderby=receivedDateTime desc&$top=100&$select=id,hasAttachments,receivedDateTime'
-        response = requests.get(messages_url, headers=headers)
+        response = _session.get(messages_url, headers=headers)
         response.raise_for_status()
         messages = response.json().get('value', [])
         
@@ -51,7 +66,7 @@ def scan_outlook_folder(access_token: str, folder_name: str = "Recruitment") ->
             
             # Get attachments
             attachments_url = f"https://graph.microsoft.com/v1.0/me/messages/{message['id']}/attachments"
-            att_response = requests.get(attachments_url, headers=headers)
+            att_response = _session.get(attachments_url, headers=headers)
             att_response.raise_for_status()
             attachments = att_response.json().get('value', [])
             
@@ -65,11 +80,11 @@ def scan_outlook_folder(access_token: str, folder_name: str = "Recruitment") ->
                         'source_id': f"{message['id']}_{att['id']}"
                     })
         
-        print(f"Found {len(cv_files)} CV files from {emails_processed} emails")
+        log.info("Found %s CV files from %s emails", len(cv_files), emails_processed)
         return cv_files
         
     except Exception as e:
-        print(f"Error scanning Outlook folder: {e}")
+        log.error("Error scanning Outlook folder: %s", e)
         return []
 
 
@@ -83,13 +98,13 @@ def scan_sharepoint_library(access_token: str, site_url: str, library_name: str)
         
         # Get site ID
         site_api_url = f"https://graph.microsoft.com/v1.0/sites/{site_url}"
-        response = requests.get(site_api_url, headers=headers)
+        response = _session.get(site_api_url, headers=headers)
         response.raise_for_status()
         site_id = response.json()['id']
         
         # Get drive (library)
         drives_url = f'https://graph.microsoft.com/v1.0/sites/{site_id}/drives'
-        response = requests.get(drives_url, headers=headers)
+        response = _session.get(drives_url, headers=headers)
         response.raise_for_status()
         drives = response.json().get('value', [])
         
@@ -100,12 +115,12 @@ def scan_sharepoint_library(access_token: str, site_url: str, library_name: str)
                 break
         
         if not drive_id:
-            print(f"Library '{library_name}' not found")
+            log.warning("Library '%s' not found", library_name)
             return []
         
         # Get files
         files_url = f'https://graph.microsoft.com/v1.0/drives/{drive_id}/root/children'
-        response = requests.get(files_url, headers=headers)
+        response = _session.get(files_url, headers=headers)
         response.raise_for_status()
         items = response.json().get('value', [])
         
@@ -124,7 +139,7 @@ def scan_sharepoint_library(access_token: str, site_url: str, library_name: str)
         return cv_files
         
     except Exception as e:
-        print(f"Error scanning SharePoint: {e}")
+        log.error("Error scanning SharePoint: %s", e)
         return []
 
 
@@ -142,7 +157,7 @@ def scan_onedrive_folder(access_token: str, folder_path: str = "CVs") -> List[Di
         else:
             folder_url = 'https://graph.microsoft.com/v1.0/me/drive/root/children'
         
-        response = requests.get(folder_url, headers=headers)
+        response = _session.get(folder_url, headers=headers)
         response.raise_for_status()
         items = response.json().get('value', [])
         
@@ -161,7 +176,7 @@ def scan_onedrive_folder(access_token: str, folder_path: str = "CVs") -> List[Di
         return cv_files
         
     except Exception as e:
-        print(f"Error scanning OneDrive: {e}")
+        log.error("Error scanning OneDrive: %s", e)
         return []
 
 
@@ -177,7 +192,7 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
         if folder_name:
             # Get specific folder
             folders_url = 'https://graph.microsoft.com/v1.0/me/mailFolders'
-            response = requests.get(folders_url, headers=headers)
+            response = _session.get(folders_url, headers=headers)
             response.raise_for_status()
             folders = response.json().get('value', [])
             
@@ -198,7 +213,7 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
                     parent_id = folder['id']
                     child_url = f'https://graph.microsoft.com/v1.0/me/mailFolders/{parent_id}/childFolders'
                     try:
-                        child_resp = requests.get(child_url, headers=headers)
+                        child_resp = _session.get(child_url, headers=headers)
                         if child_resp.status_code == 200:
                             child_folders = child_resp.json().get('value', [])
                             for child in child_folders:
@@ -206,7 +221,7 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
                                 available_folders.append(f"  → {folder.get('displayName')}/{child_display}")
                                 if child_display.lower() == folder_name.lower():
                                     folder_id = child['id']
-                                    print(f"Found folder '{folder_name}' as subfolder of '{folder.get('displayName')}'")
+                                    log.info("Found folder '%s' as subfolder of '%s'", folder_name, folder.get('displayName'))
                                     break
                     except:
                         pass
@@ -214,7 +229,7 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
                         break
             
             if not folder_id:
-                print(f"Folder '{folder_name}' not found. Available folders: {available_folders}")
+                log.warning("Folder '%s' not found. Available folders: %s", folder_name, available_folders)
                 return []
             
             # Get newest emails first (fetch more to account for those without attachments)
@@ -223,7 +238,7 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
             # Scan inbox - get newest emails first
             messages_url = f'https://graph.microsoft.com/v1.0/me/messages?$orderby=receivedDateTime desc&$top=100&$select=id,hasAttachments,receivedDateTime'
         
-        response = requests.get(messages_url, headers=headers)
+        response = _session.get(messages_url, headers=headers)
         response.raise_for_status()
         messages = response.json().get('value', [])
         
@@ -241,7 +256,7 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
             
             # Get attachments
             attachments_url = f"https://graph.microsoft.com/v1.0/me/messages/{message['id']}/attachments"
-            att_response = requests.get(attachments_url, headers=headers)
+            att_response = _session.get(attachments_url, headers=headers)
             att_response.raise_for_status()
             attachments = att_response.json().get('value', [])
             
@@ -256,11 +271,11 @@ def scan_email_attachments(access_token: str, folder_name: Optional[str] = None,
                         'source_id': f"{message['id']}_{att['id']}"
                     })
         
-        print(f"Found {len(cv_files)} CV files from {emails_with_attachments} emails with attachments")
+        log.info("Found %s CV files from %s emails with attachments", len(cv_files), emails_with_attachments)
         return cv_files
         
     except Exception as e:
-        print(f"Error scanning emails: {e}")
+        log.error("Error scanning emails: %s", e)
         return []
 
 
@@ -271,7 +286,7 @@ def download_file(url: str, save_path: str, access_token: Optional[str] = None)
         if access_token:
             headers['Authorization'] = f'Bearer {access_token}'
         
-        response = requests.get(url, headers=headers, stream=True)
+        response = _session.get(url, headers=headers, stream=True)
         response.raise_for_status()
         
         with open(save_path, 'wb') as f:
@@ -280,7 +295,7 @@ def download_file(url: str, save_path: str, access_token: Optional[str] = None)
         
         return True
     except Exception as e:
-        print(f"Error downloading file: {e}")
+        log.error("Error downloading file: %s", e)
         return False
 
 
@@ -293,5 +308,5 @@ def save_base64_file(base64_content: str, save_path: str) -> bool:
             f.write(file_data)
         return True
     except Exception as e:
-        print(f"Error saving base64 file: {e}")
+        log.error("Error saving base64 file: %s", e)
         return False
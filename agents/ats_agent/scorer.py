@@ -2,10 +2,14 @@
 AI-Powered Scoring Module - OpenAI integration for CV evaluation
 """
 import json
+import logging
 import openai
 from typing import Dict, Optional
 
 
+log = logging.getLogger(__name__)
+
+
 def get_openai_client(api_key: str):
     """Get OpenAI client with API key."""
     return openai.OpenAI(api_key=api_key)
@@ -96,7 +100,7 @@ Respond in JSON format with this structure:
         return result
         
     except Exception as e:
-        print(f"Error scoring CV with OpenAI: {e}")
+        log.error("Error scoring CV with OpenAI: %s", e)
         return None
 
 
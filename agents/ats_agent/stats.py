@@ -0,0 +1,46 @@
+"""
+ATS Dashboard Statistics - Cached aggregate queries for the dashboard
+"""
+from models import db, ATSAgentConfig, CVCandidate
+from utils.cache import cache
+
+
+DASHBOARD_STATS_TIMEOUT = 60  # seconds
+
+
+@cache.memoize(timeout=DASHBOARD_STATS_TIMEOUT)
+def get_dashboard_stats(user_id):
+    """
+    Compute ATS dashboard statistics for a user.
+    Returns (total_cvs, scored_cvs, filtered_cvs, avg_score, top_candidate_ids).
+    Cached per user; call invalidate_dashboard_stats() after writing candidates.
+    """
+    # Counts and average score per status in one query
+    status_rows = db.session.query(
+        CVCandidate.status,
+        db.func.count(CVCandidate.id),
+        db.func.avg(db.func.coalesce(CVCandidate.final_weighted_score, 0))
+    ).filter_by(user_id=user_id).group_by(CVCandidate.status).all()
+    
+    counts = {status: count for status, count, _ in status_rows}
+    total_cvs = sum(counts.values())
+    scored_cvs = counts.get('scored', 0)
+    filtered_cvs = counts.get('filtered_out', 0)
+    avg_score = next((float(avg or 0) for status, _, avg in status_rows if status == 'scored'), 0)
+    
+    # Top candidates (ids only so the cached value stays small)
+    config = ATSAgentConfig.query.filter_by(user_id=user_id).first()
+    top_n = config.top_n_candidates if config else 10
+    top_candidate_ids = [
+        candidate_id for (candidate_id,) in db.session.query(CVCandidate.id)
+        .filter_by(user_id=user_id, status='scored')
+        .order_by(CVCandidate.final_weighted_score.desc())
+        .limit(top_n).all()
+    ]
+    
+    return total_cvs, scored_cvs, filtered_cvs, round(avg_score, 1), top_candidate_ids
+
+
+def invalidate_dashboard_stats(user_id):
+    """Drop cached dashboard statistics for a user."""
+    cache.delete_memoized(get_dashboard_stats, user_id)
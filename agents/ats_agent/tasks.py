@@ -1,18 +1,26 @@
 """
 ATS Agent Celery Tasks
 """
-from celery_worker import celery
+from celery_worker import celery, get_flask_app
 from models import db, ATSAgentConfig, CVCandidate, ATSScanHistory, UserSettings
 from agents.ats_agent.scanner import scan_onedrive_folder, scan_email_attachments, scan_sharepoint_library, download_file, save_base64_file
 from agents.ats_agent.parser import extract_text_from_cv, parse_cv_basic_info
 from agents.ats_agent.filters import apply_hard_filters
 from agents.ats_agent.scorer import score_cv_with_openai, calculate_weighted_score
+from agents.ats_agent.stats import invalidate_dashboard_stats
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from werkzeug.utils import secure_filename
+import logging
 import os
+import re
+import uuid
 
 
+log = logging.getLogger(__name__)
+
 UPLOAD_FOLDER = 'static/uploads/cvs'
+SCORING_WORKERS = 8  # Concurrent OpenAI scoring requests per scan
 
 
 @celery.task(name='ats_agent.scheduled_scan')
@@ -21,33 +29,92 @@ def scheduled_ats_scan():
     Scheduled task to scan for CVs from all configured sources and process them.
     Runs for all users who have ATS agent enabled.
     """
-    from app import create_app
-    app = create_app()
+    app = get_flask_app()
     
     with app.app_context():
-        # Get all users with ATS enabled
-        configs = ATSAgentConfig.query.filter_by(is_enabled=True).all()
+        # Get all users with ATS enabled and an OpenAI key (the scan needs both)
+        user_ids = db.session.scalars(
+            db.select(ATSAgentConfig.user_id)
+            .join(UserSettings, UserSettings.user_id == ATSAgentConfig.user_id)
+            .where(ATSAgentConfig.is_enabled.is_(True), UserSettings._openai_api_key.isnot(None))
+        ).all()
         
-        for config in configs:
+        for user_id in user_ids:
             try:
-                process_ats_scan(config.user_id)
+                process_ats_scan(user_id)
             except Exception as e:
-                print(f"Error processing ATS scan for user {config.user_id}: {e}")
+                log.error("Error processing ATS scan for user %s: %s", user_id, e)
+
+
+def _mark_scan_failed(scan, message):
+    """Mark a pre-created scan history record as failed."""
+    if not scan:
+        return
+    scan.status = 'failed'
+    scan.error_message = message
+    scan.scan_completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _apply_score_result(candidate, score_result, weights):
+    """Copy OpenAI scoring results onto a candidate record."""
+    # Update candidate with scores
+    candidate.skills_score = score_result.get('skills_score')
+    candidate.skills_reasoning = score_result.get('skills_reasoning')
+    candidate.title_score = score_result.get('title_score')
+    candidate.title_reasoning = score_result.get('title_reasoning')
+    candidate.experience_score = score_result.get('experience_score')
+    candidate.experience_reasoning = score_result.get('experience_reasoning')
+    candidate.education_score = score_result.get('education_score')
+    candidate.education_reasoning = score_result.get('education_reasoning')
+    candidate.keywords_score = score_result.get('keywords_score')
+    candidate.keywords_reasoning = score_result.get('keywords_reasoning')
+    candidate.overall_assessment = score_result.get('overall_assessment')
+    candidate.red_flags = score_result.get('red_flags', [])
+    
+    # Calculate weighted score
+    candidate.final_weighted_score = calculate_weighted_score(score_result, weights)
+    
+    # Update extracted data - sanitize numeric fields
+    yoe = score_result.get('years_of_experience')
+    if isinstance(yoe, (int, float)):
+        candidate.years_of_experience = yoe
+    elif isinstance(yoe, str):
+        # Try to extract number from string
+        numbers = re.findall(r'[\d.]+', yoe)
+        candidate.years_of_experience = float(numbers[0]) if numbers else None
+    else:
+        candidate.years_of_experience = None
+    
+    candidate.location = score_result.get('location')
+    candidate.current_job_title = score_result.get('current_title')
+    candidate.skills = score_result.get('extracted_skills', [])
+    
+    candidate.status = 'scored'
+    candidate.processed_at = datetime.utcnow()
 
 
-@celery.task(name='ats_agent.process_scan')
-def process_ats_scan(user_id):
-    """Process ATS scan for a specific user (Celery background task)."""
-    from app import create_app
-    app = create_app('production')
+@celery.task(bind=True, acks_late=True, name='ats_agent.process_scan')
+def process_ats_scan(self, user_id, scan_id=None):
+    """
+    Process ATS scan for a specific user (Celery background task).
+    If scan_id is given, the ATSScanHistory record created by the caller is
+    updated in place so the frontend can poll it for status.
+    """
+    app = get_flask_app()
     
     with app.app_context():
-        config = ATSAgentConfig.query.filter_by(user_id=user_id).first()
+        # Reuse the scan history record created by the caller, if any
+        scan = db.session.get(ATSScanHistory, scan_id) if scan_id else None
+        
+        config = db.session.scalars(db.select(ATSAgentConfig).filter_by(user_id=user_id)).first()
         if not config or not config.is_enabled:
+            _mark_scan_failed(scan, 'ATS agent not configured or disabled')
             return
         
-        settings = UserSettings.query.filter_by(user_id=user_id).first()
+        settings = db.session.scalars(db.select(UserSettings).filter_by(user_id=user_id)).first()
         if not settings or not settings.openai_api_key:
+            _mark_scan_failed(scan, 'OpenAI API key not configured')
             return
         
         # Get valid access token (refresh if needed)
@@ -56,62 +123,84 @@ def process_ats_scan(user_id):
             from utils.ms_auth import get_valid_access_token
             access_token = get_valid_access_token(settings, db)
             if not access_token:
-                print(f"Failed to get valid access token for user {user_id}")
+                log.error("Failed to get valid access token for user %s", user_id)
+                _mark_scan_failed(scan, 'Microsoft access token expired. Please re-authenticate.')
                 return
-
         
         # Create scan history record
-        scan = ATSScanHistory(user_id=user_id, status='running')
-        db.session.add(scan)
-        db.session.commit()
+        if not scan:
+            scan = ATSScanHistory(user_id=user_id, status='running')
+            db.session.add(scan)
+            db.session.commit()
         
         try:
-            cv_files = []
+            # Scan each enabled source concurrently - these are independent Graph API calls
+            source_scans = []
             
             # Scan OneDrive
             if config.onedrive_enabled and access_token:
-                onedrive_cvs = scan_onedrive_folder(access_token, config.onedrive_folder_path)
-                cv_files.extend(onedrive_cvs)
+                source_scans.append((scan_onedrive_folder, (access_token, config.onedrive_folder_path)))
             
             # Scan Email Inbox
             if config.email_inbox_enabled and access_token:
-                inbox_cvs = scan_email_attachments(access_token, folder_name=None)
-                cv_files.extend(inbox_cvs)
+                source_scans.append((scan_email_attachments, (access_token, None)))
             
             # Scan Email Folder
             if config.email_folder_enabled and access_token:
-                folder_cvs = scan_email_attachments(access_token, config.email_folder_name)
-                cv_files.extend(folder_cvs)
+                source_scans.append((scan_email_attachments, (access_token, config.email_folder_name)))
             
             # Scan SharePoint
             if config.sharepoint_enabled and config.sharepoint_site_url and access_token:
-                sp_cvs = scan_sharepoint_library(
+                source_scans.append((scan_sharepoint_library, (
                     access_token,
                     config.sharepoint_site_url,
                     config.sharepoint_library
-                )
-                cv_files.extend(sp_cvs)
+                )))
+            
+            cv_files = []
+            if source_scans:
+                with ThreadPoolExecutor(max_workers=len(source_scans)) as executor:
+                    futures = [executor.submit(scan_fn, *args) for scan_fn, args in source_scans]
+                    # Collect in source order so deduplication stays deterministic
+                    for future in futures:
+                        cv_files.extend(future.result())
             
             scan.total_cvs_found = len(cv_files)
             
             processed = 0
             scored = 0
             filtered = 0
+            candidates = []
+            to_score = []
+            
+            # Apply hard filters
+            filter_config = {
+                'allowed_locations': config.allowed_locations,
+                'min_experience': config.min_experience,
+                'max_experience': config.max_experience,
+                'must_have_skills': config.must_have_skills
+            }
+            
+            # Load already processed source files once instead of querying per CV
+            seen_source_ids = set(db.session.scalars(
+                db.select(CVCandidate.source_file_id).filter_by(user_id=user_id)
+            ))
+            seen_emails = set(db.session.scalars(
+                db.select(CVCandidate.email).filter_by(user_id=user_id).where(CVCandidate.email.isnot(None))
+            ))
+            
+            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
             
             # Process each CV
             for cv_file in cv_files:
-                # Skip if already processed
-                existing = CVCandidate.query.filter_by(
-                    user_id=user_id,
-                    source_file_id=cv_file['source_id']
-                ).first()
-                if existing:
+                # Skip if already processed (or seen earlier in this scan)
+                if cv_file['source_id'] in seen_source_ids:
                     continue
+                seen_source_ids.add(cv_file['source_id'])
                 
                 # Download/save file
                 filename = secure_filename(cv_file['filename'])
-                filepath = os.path.join(UPLOAD_FOLDER, f"{user_id}_{datetime.now().timestamp()}_{filename}")
-                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                filepath = os.path.join(UPLOAD_FOLDER, f"{user_id}_{uuid.uuid4().hex}_{filename}")
                 
                 if cv_file.get('download_url'):
                     download_file(cv_file['download_url'], filepath, access_token)
@@ -131,13 +220,10 @@ def process_ats_scan(user_id):
                 # Skip if candidate with same email already exists (deduplication)
                 candidate_email = basic_info.get('email')
                 if candidate_email:
-                    existing_by_email = CVCandidate.query.filter_by(
-                        user_id=user_id,
-                        email=candidate_email
-                    ).first()
-                    if existing_by_email:
-                        print(f"Skipping duplicate candidate: {candidate_email}")
+                    if candidate_email in seen_emails:
+                        log.debug("Skipping duplicate candidate: %s", candidate_email)
                         continue
+                    seen_emails.add(candidate_email)
 
                 
                 # Create candidate record
@@ -154,81 +240,49 @@ def process_ats_scan(user_id):
                     linkedin_url=basic_info.get('linkedin_url')
                 )
                 
-                # Apply hard filters
-                filter_config = {
-                    'allowed_locations': config.allowed_locations,
-                    'min_experience': config.min_experience,
-                    'max_experience': config.max_experience,
-                    'must_have_skills': config.must_have_skills
-                }
-                
                 passed, reasons = apply_hard_filters({'cv_text': cv_text}, filter_config)
                 
                 if not passed:
                     candidate.status = 'filtered_out'
                     filtered += 1
                 else:
-                    # Score with OpenAI
-                    job_config = {
-                        'job_title': config.job_title,
-                        'job_description': config.job_description,
-                        'required_skills': config.required_skills
-                    }
-                    
-                    score_result = score_cv_with_openai(
-                        {'cv_text': cv_text},
-                        job_config,
-                        settings.openai_api_key
-                    )
-                    
-                    if score_result:
-                        # Update candidate with scores
-                        candidate.skills_score = score_result.get('skills_score')
-                        candidate.skills_reasoning = score_result.get('skills_reasoning')
-                        candidate.title_score = score_result.get('title_score')
-                        candidate.title_reasoning = score_result.get('title_reasoning')
-                        candidate.experience_score = score_result.get('experience_score')
-                        candidate.experience_reasoning = score_result.get('experience_reasoning')
-                        candidate.education_score = score_result.get('education_score')
-                        candidate.education_reasoning = score_result.get('education_reasoning')
-                        candidate.keywords_score = score_result.get('keywords_score')
-                        candidate.keywords_reasoning = score_result.get('keywords_reasoning')
-                        candidate.overall_assessment = score_result.get('overall_assessment')
-                        candidate.red_flags = score_result.get('red_flags', [])
-                        
-                        # Calculate weighted score
-                        weights = {
-                            'weight_skills': config.weight_skills,
-                            'weight_title': config.weight_title,
-                            'weight_experience': config.weight_experience,
-                            'weight_education': config.weight_education,
-                            'weight_keywords': config.weight_keywords
-                        }
-                        candidate.final_weighted_score = calculate_weighted_score(score_result, weights)
-                        
-                        # Update extracted data - sanitize numeric fields
-                        yoe = score_result.get('years_of_experience')
-                        if isinstance(yoe, (int, float)):
-                            candidate.years_of_experience = yoe
-                        elif isinstance(yoe, str):
-                            # Try to extract number from string
-                            import re
-                            numbers = re.findall(r'[\d.]+', yoe)
-                            candidate.years_of_experience = float(numbers[0]) if numbers else None
-                        else:
-                            candidate.years_of_experience = None
-                        
-                        candidate.location = score_result.get('location')
-                        candidate.current_job_title = score_result.get('current_title')
-                        candidate.skills = score_result.get('extracted_skills', [])
-                        
-                        candidate.status = 'scored'
-                        candidate.processed_at = datetime.utcnow()
-                        scored += 1
+                    to_score.append(candidate)
                 
-                db.session.add(candidate)
+                candidates.append(candidate)
                 processed += 1
             
+            # Score with OpenAI - calls are HTTP-bound, so run them concurrently.
+            # Only the OpenAI requests happen in worker threads; all ORM updates
+            # stay on this thread to avoid sharing the session across threads.
+            job_config = {
+                'job_title': config.job_title,
+                'job_description': config.job_description,
+                'required_skills': config.required_skills
+            }
+            weights = {
+                'weight_skills': config.weight_skills,
+                'weight_title': config.weight_title,
+                'weight_experience': config.weight_experience,
+                'weight_education': config.weight_education,
+                'weight_keywords': config.weight_keywords
+            }
+            openai_api_key = settings.openai_api_key
+            
+            if to_score:
+                with ThreadPoolExecutor(max_workers=SCORING_WORKERS) as executor:
+                    score_results = list(executor.map(
+                        lambda cv_text: score_cv_with_openai({'cv_text': cv_text}, job_config, openai_api_key),
+                        [candidate.cv_text for candidate in to_score]
+                    ))
+                
+                for candidate, score_result in zip(to_score, score_results):
+                    if score_result:
+                        _apply_score_result(candidate, score_result, weights)
+                        scored += 1
+            
+            # Insert all new candidates in one batch
+            db.session.bulk_save_objects(candidates)
+            
             # Update scan history
             scan.cvs_processed = processed
             scan.cvs_scored = scored
@@ -237,7 +291,8 @@ def process_ats_scan(user_id):
             scan.scan_completed_at = datetime.utcnow()
             
             db.session.commit()
-            print(f"ATS scan completed for user {user_id}: {scored} scored, {filtered} filtered")
+            invalidate_dashboard_stats(user_id)
+            log.info("ATS scan completed for user %s: %s scored, %s filtered", user_id, scored, filtered)
             
         except Exception as e:
             # Rollback any pending transaction first
@@ -251,4 +306,4 @@ def process_ats_scan(user_id):
             except:
                 db.session.rollback()
             
-            print(f"ATS scan failed for user {user_id}: {e}")
+            log.error("ATS scan failed for user %s: %s", user_id, e)
@@ -4,12 +4,15 @@ Processes emails and creates ClickUp tasks
 """
 import os
 import json
+import asyncio
 import httpx
 import difflib
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from openai import AsyncOpenAI
 from bs4 import BeautifulSoup
+from sqlalchemy.exc import IntegrityError
 from models import db, ProcessedEmail
 
 # Timezone
@@ -23,9 +26,11 @@ CLICKUP_API = "https://api.clickup.com/api/v2"
 class EmailAgentService:
     """Service for processing emails and creating ClickUp tasks."""
     
-    def __init__(self, user):
+    def __init__(self, user, http_client=None):
         self.user = user
         self.config = user.email_config
+        # Optional long-lived httpx.AsyncClient owned by the caller (reused across runs)
+        self.http_client = http_client
         self.settings = user.settings
         self.logs = []
         
@@ -39,8 +44,13 @@ class EmailAgentService:
         self.clickup_names_list = []
         self.clickup_tasks = []
     
-    async def process_emails(self):
-        """Main entry point for email processing."""
+    async def process_emails(self, commit=True, email_ids=None):
+        """
+        Main entry point for email processing.
+        Scans the recent inbox, or only the given email_ids (webhook batches).
+        With commit=False the ProcessedEmail rows are left pending so the caller
+        can commit them together with its own writes.
+        """
         result = {
             'success': False,
             'emails_checked': 0,
@@ -64,7 +74,9 @@ class EmailAgentService:
             # Update the token for this session
             self.ms_access_token = access_token
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            # Use the caller's shared client if given, otherwise a client for this run only
+            async with (nullcontext(self.http_client) if self.http_client
+                        else httpx.AsyncClient(timeout=30.0)) as client:
                 # Get current user email
                 headers = {"Authorization": f"Bearer {access_token}"}
                 my_email = await self._get_current_user_email(client, headers)
@@ -76,15 +88,20 @@ class EmailAgentService:
                 
                 my_id = self.clickup_users.get(my_email.lower()) if my_email else None
                 
-                # Get recent emails
-                emails = await self._get_recent_emails(client, headers)
+                # Get recent emails (or just the notified ones)
+                if email_ids is None:
+                    emails = await self._get_recent_emails(client, headers)
+                else:
+                    emails = await self._get_emails_by_id(client, headers, email_ids)
                 result['emails_checked'] = len(emails)
                 self.logs.append(f"📧 Recent Emails: {len(emails)}")
                 
-                # Load processed emails log
-                processed_ids = set(
-                    e.email_id for e in ProcessedEmail.query.filter_by(user_id=self.user.id).all()
-                )
+                # Load which of these emails were already processed (ids only,
+                # looked up through the (user_id, email_id) unique index)
+                processed_ids = set(db.session.scalars(
+                    db.select(ProcessedEmail.email_id).filter_by(user_id=self.user.id)
+                    .where(ProcessedEmail.email_id.in_([email['id'] for email in emails]))
+                )) if emails else set()
                 
                 tasks_created = 0
                 
@@ -98,7 +115,7 @@ class EmailAgentService:
                     s_email = sender.get('address', '').lower()
                     
                     # Check if sender is allowed
-                    if self.config.allowed_senders and s_email not in [s.lower() for s in self.config.allowed_senders]:
+                    if self.config.allowed_senders_set and s_email not in self.config.allowed_senders_set:
                         continue
                     
                     # Check for sensitive keywords
@@ -107,7 +124,25 @@ class EmailAgentService:
                         continue
                     
                     # Check ignore prefixes
-                    if any(subject.startswith(p) for p in self.config.ignore_subject_prefixes):
+                    ignore_re = self.config.ignore_subject_re
+                    if ignore_re and ignore_re.match(subject):
+                        continue
+                    
+                    # Claim the email before any ClickUp side effects: the insert is
+                    # flushed in a savepoint, so if another run (webhook batch or
+                    # scheduled scan) already has it, we skip it here instead of
+                    # failing at commit after creating duplicate tasks
+                    processed = ProcessedEmail(
+                        user_id=self.user.id,
+                        email_id=msg_id,
+                        subject=subject[:500],
+                        sender=s_email,
+                        tasks_created=0
+                    )
+                    try:
+                        with db.session.begin_nested():
+                            db.session.add(processed)
+                    except IntegrityError:
                         continue
                     
                     self.logs.append(f"Processing: {subject[:50]}")
@@ -139,16 +174,10 @@ class EmailAgentService:
                         self.logs.append("💤 No actions.")
                     
                     # Log processed email
-                    processed = ProcessedEmail(
-                        user_id=self.user.id,
-                        email_id=msg_id,
-                        subject=subject[:500],
-                        sender=s_email,
-                        tasks_created=email_tasks_created
-                    )
-                    db.session.add(processed)
+                    processed.tasks_created = email_tasks_created
                 
-                db.session.commit()
+                if commit:
+                    db.session.commit()
                 
                 result['success'] = True
                 result['tasks_created'] = tasks_created
@@ -174,6 +203,16 @@ class EmailAgentService:
         response = await client.get(url, headers=headers)
         return response.json().get('value', []) if response.status_code == 200 else []
     
+    async def _get_emails_by_id(self, client, headers, email_ids):
+        """Get specific emails by id (fetched concurrently, missing ones skipped)."""
+        async def get_email(email_id):
+            url = f"{GRAPH_API}/me/messages/{email_id}?$select=id,subject,body,from,receivedDateTime,hasAttachments,toRecipients,ccRecipients"
+            response = await client.get(url, headers=headers)
+            return response.json() if response.status_code == 200 else None
+        
+        emails = await asyncio.gather(*(get_email(email_id) for email_id in email_ids))
+        return [email for email in emails if email]
+    
     async def _refresh_clickup_cache(self, client):
         """Refresh ClickUp users and tasks cache."""
         if not self.clickup_api_key:
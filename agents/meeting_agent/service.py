@@ -6,8 +6,10 @@ import os
 import re
 import json
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta, timezone
 from openai import OpenAI
+from sqlalchemy.exc import IntegrityError
 from models import db, ProcessedMeeting
 
 # API Endpoints
@@ -15,6 +17,11 @@ GRAPH_API = "https://graph.microsoft.com/v1.0"
 CLICKUP_API = "https://api.clickup.com/api/v2"
 CLICKUP_API_V3 = "https://api.clickup.com/api/v3"
 
+# Shared HTTP session: keeps Graph/ClickUp connections alive across calls and
+# across scans run by the same worker process (no TLS handshake per request)
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
 
 class MeetingAgentService:
     """Service for processing meetings and creating ClickUp tasks."""
@@ -34,12 +41,16 @@ class MeetingAgentService:
         self.clickup_users = {}
         self.clickup_tasks = []
     
-    async def process_meetings(self):
-        """Main entry point for meeting processing."""
+    async def process_meetings(self, commit=True):
+        """
+        Main entry point for meeting processing.
+        With commit=False the ProcessedMeeting rows are left pending so the caller
+        can commit them together with its own writes.
+        """
         # Run synchronously since Graph API calls are sync
-        return self._process_meetings_sync()
+        return self._process_meetings_sync(commit)
     
-    def _process_meetings_sync(self):
+    def _process_meetings_sync(self, commit=True):
         """Synchronous meeting processing."""
         result = {
             'success': False,
@@ -109,9 +120,9 @@ class MeetingAgentService:
             self.logs.append(f"🔍 Unique Meetings Found: {len(unique_meetings)}")
             
             # Load processed transcripts
-            processed_ids = set(
-                m.transcript_id for m in ProcessedMeeting.query.filter_by(user_id=self.user.id).all()
-            )
+            processed_ids = set(db.session.scalars(
+                db.select(ProcessedMeeting.transcript_id).filter_by(user_id=self.user.id)
+            ))
             
             tasks_created = 0
             summaries_created = 0
@@ -140,7 +151,8 @@ class MeetingAgentService:
                     summaries_created += sc
                     processed_mids.add(mid)
             
-            db.session.commit()
+            if commit:
+                db.session.commit()
             
             result['success'] = True
             result['tasks_created'] = tasks_created
@@ -160,7 +172,7 @@ class MeetingAgentService:
         
         headers = {"Authorization": self.clickup_api_key}
         try:
-            resp = requests.get(f"{CLICKUP_API}/team", headers=headers)
+            resp = _session.get(f"{CLICKUP_API}/team", headers=headers)
             if resp.status_code == 200:
                 teams = resp.json().get('teams', [])
                 if teams:
@@ -185,7 +197,7 @@ class MeetingAgentService:
         params = {"archived": "false", "subtasks": "true"}
         
         try:
-            resp = requests.get(
+            resp = _session.get(
                 f"{CLICKUP_API}/list/{self.config.clickup_list_id}/task",
                 headers=headers, params=params
             )
@@ -204,7 +216,7 @@ class MeetingAgentService:
         events = []
         
         while True:
-            resp = requests.get(url, headers=headers)
+            resp = _session.get(url, headers=headers)
             if resp.status_code != 200:
                 return events
             data = resp.json()
@@ -221,7 +233,7 @@ class MeetingAgentService:
         chats = []
         
         try:
-            resp = requests.get(url, headers=headers)
+            resp = _session.get(url, headers=headers)
             if resp.status_code != 200:
                 return []
             
@@ -275,7 +287,7 @@ class MeetingAgentService:
         url = f"{GRAPH_API}/me/onlineMeetings?$filter=JoinWebUrl%20eq%20'{encoded}'"
         
         try:
-            resp = requests.get(url, headers=headers)
+            resp = _session.get(url, headers=headers)
             if resp.status_code == 200:
                 items = resp.json().get("value", [])
                 if items:
@@ -311,6 +323,21 @@ class MeetingAgentService:
             
             self.logs.append(f"✓ Transcript downloaded ({len(transcript_text)} chars)")
             
+            # Claim the transcript before any ClickUp side effects (flushed in a
+            # savepoint, so a run that already has it is skipped, not duplicated)
+            processed = ProcessedMeeting(
+                user_id=self.user.id,
+                transcript_id=transcript_id,
+                meeting_subject=subject[:500],
+                tasks_created=0,
+                standup_summary_created=False
+            )
+            try:
+                with db.session.begin_nested():
+                    db.session.add(processed)
+            except IntegrityError:
+                continue
+            
             # Check if standup meeting
             is_standup = any(
                 kw.lower() in subject.lower() 
@@ -334,14 +361,8 @@ class MeetingAgentService:
                         tasks_created += 1
             
             # Log processed meeting
-            processed = ProcessedMeeting(
-                user_id=self.user.id,
-                transcript_id=transcript_id,
-                meeting_subject=subject[:500],
-                tasks_created=len(tasks) if tasks else 0,
-                standup_summary_created=is_standup and summaries_created > 0
-            )
-            db.session.add(processed)
+            processed.tasks_created = len(tasks) if tasks else 0
+            processed.standup_summary_created = is_standup and summaries_created > 0
         
         return tasks_created, summaries_created
     
@@ -349,7 +370,7 @@ class MeetingAgentService:
         """Get list of transcripts for a meeting."""
         url = f"{GRAPH_API}/me/onlineMeetings/{meeting_id}/transcripts"
         try:
-            resp = requests.get(url, headers=headers)
+            resp = _session.get(url, headers=headers)
             if resp.status_code == 200:
                 transcripts = resp.json().get("value", [])
                 transcripts.sort(key=lambda x: x.get('createdDateTime', ''), reverse=True)
@@ -362,7 +383,7 @@ class MeetingAgentService:
         """Download transcript content."""
         url = f"{GRAPH_API}/me/onlineMeetings/{meeting_id}/transcripts/{transcript_id}/content?$format=text/vtt"
         try:
-            resp = requests.get(url, headers=headers)
+            resp = _session.get(url, headers=headers)
             if resp.status_code == 200:
                 return self._vtt_to_text(resp.text)
         except:
@@ -477,7 +498,7 @@ class MeetingAgentService:
         
         try:
             # Get workspace ID
-            resp = requests.get(f"{CLICKUP_API}/team", headers=headers)
+            resp = _session.get(f"{CLICKUP_API}/team", headers=headers)
             if resp.status_code != 200:
                 self.logs.append(f"❌ Failed to get workspace: {resp.status_code}")
                 return False
@@ -495,7 +516,7 @@ class MeetingAgentService:
             params = {"parent_id": self.config.target_space_id, "parent_type": 4}
             
             self.logs.append(f"📂 Searching docs in space {self.config.target_space_id}...")
-            resp = requests.get(docs_url, headers=headers, params=params)
+            resp = _session.get(docs_url, headers=headers, params=params)
             if resp.status_code != 200:
                 self.logs.append(f"❌ Failed to list docs: {resp.status_code} - {resp.text[:200]}")
                 return False
@@ -521,7 +542,7 @@ class MeetingAgentService:
             
             # Get page ID
             pages_url = f"{CLICKUP_API_V3}/workspaces/{workspace_id}/docs/{doc_id}/pages"
-            resp = requests.get(pages_url, headers=headers)
+            resp = _session.get(pages_url, headers=headers)
             if resp.status_code != 200:
                 self.logs.append(f"❌ Failed to get pages: {resp.status_code}")
                 return False
@@ -544,7 +565,7 @@ class MeetingAgentService:
             }
             
             self.logs.append(f"📤 Appending summary to page...")
-            resp = requests.put(update_url, headers=headers, json=payload)
+            resp = _session.put(update_url, headers=headers, json=payload)
             
             if resp.status_code in [200, 204]:
                 self.logs.append("✅ Summary successfully written to ClickUp Doc!")
@@ -607,7 +628,7 @@ class MeetingAgentService:
         
         try:
             headers = {"Authorization": self.clickup_api_key, "Content-Type": "application/json"}
-            resp = requests.post(
+            resp = _session.post(
                 f"{CLICKUP_API}/list/{self.config.clickup_list_id}/task",
                 headers=headers,
                 json=payload
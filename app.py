@@ -2,10 +2,12 @@
 Unified AI Agents - Flask Application
 """
 import os
+import logging
 from flask import Flask, redirect, url_for
 from flask_login import LoginManager
 from models import db, User
 from config import config
+from utils.cache import cache
 
 login_manager = LoginManager()
 
@@ -18,8 +20,14 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
+    logging.basicConfig(
+        level=app.config['LOG_LEVEL'],
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    )
+    
     # Initialize extensions
     db.init_app(app)
+    cache.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
@@ -45,9 +53,8 @@ def create_app(config_name=None):
     def index():
         return redirect(url_for('auth.dashboard'))
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Database schema is managed by scripts/migrate_db.py at deploy time,
+    # not created on every worker boot
     
     return app
 
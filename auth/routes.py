@@ -36,7 +36,7 @@ def register():
             flash('Password must be at least 6 characters.', 'error')
             return render_template('auth/register.html')
         
-        if User.query.filter_by(email=email).first():
+        if db.session.query(User.query.filter_by(email=email).exists()).scalar():
             flash('Email already registered.', 'error')
             return render_template('auth/register.html')
         
@@ -8,8 +8,16 @@ import sys
 # Add the current directory to Python path for module imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from celery import Celery
+import asyncio
+import threading
+import time
+from datetime import timedelta
+
+from celery import Celery, group
 from celery.schedules import crontab
+from celery.signals import worker_process_init
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 # Initialize Celery
 celery = Celery('unified_app')
@@ -25,37 +33,77 @@ celery.conf.update(
     enable_utc=True,
     task_track_started=True,
     task_time_limit=600,  # 10 minute timeout per task
+    task_soft_time_limit=540,  # Raise SoftTimeLimitExceeded first so tasks can clean up
     worker_prefetch_multiplier=1,
     task_acks_late=True,
+    # Keep a pool of live broker connections so dispatcher fan-outs reuse them
+    broker_pool_limit=50,
+    broker_transport_options={
+        'socket_keepalive': True,
+        'health_check_interval': 30,
+        'visibility_timeout': 3600,  # Longer than task_time_limit, so acks_late tasks aren't redelivered mid-run
+    },
+    # Short webhook-triggered tasks get their own queue/worker so they never
+    # wait behind long full-user scans. The realtime tasks are pure I/O, so that
+    # worker runs a thread pool instead of prefork:
+    #   celery -A celery_worker.celery worker -Ofair --prefetch-multiplier=1
+    #   celery -A celery_worker.celery worker -Q realtime -P threads -c 20
+    # Each realtime thread holds a DB connection for most of its task, so -c must
+    # stay within DB_POOL_SIZE + DB_MAX_OVERFLOW (30 by default). The threads
+    # pool doesn't enforce task time limits; see REALTIME_TASK_TIMEOUT.
+    task_routes={
+        'celery_worker.process_new_email_notification': {'queue': 'realtime'},
+        'celery_worker.process_user_email_batch': {'queue': 'realtime'},
+        'celery_worker.flush_user_email_notifications': {'queue': 'realtime'},
+    },
+)
+
+# Beat runs on the Redis-backed RedBeat scheduler: schedule state survives
+# restarts and the Redis lock means only one beat instance fires each entry,
+# even with several beat replicas running
+celery.conf.update(
+    beat_scheduler='redbeat.RedBeatScheduler',
+    redbeat_redis_url=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+    redbeat_lock_timeout=60,
+    # Beat renews the lock once per tick, so it must never sleep longer than
+    # the lock timeout or a second replica could take over mid-sleep
+    beat_max_loop_interval=15,
 )
 
 # Beat schedule - periodic tasks
 celery.conf.beat_schedule = {
     'scan-meetings-every-30-minutes': {
         'task': 'celery_worker.scan_all_users_meetings',
-        'schedule': 30 * 60,  # 30 minutes in seconds
+        'schedule': timedelta(minutes=30),
     },
     'scan-emails-every-5-minutes': {
         'task': 'celery_worker.scan_all_users_emails',
-        'schedule': 5 * 60,  # 5 minutes in seconds
+        'schedule': timedelta(minutes=5),
     },
     'scan-ats-every-30-minutes': {
         'task': 'ats_agent.scheduled_scan',
-        'schedule': 30 * 60,  # 30 minutes in seconds
+        'schedule': timedelta(minutes=30),
     },
 }
 
-# Import ATS tasks to register them with Celery
-import agents.ats_agent.tasks  # noqa: F401
+# Flask app shared by every task in this worker process, so the SQLAlchemy
+# engine and its connection pool are built once instead of once per task
+_flask_app = None
+_flask_app_lock = threading.Lock()
 
+# Event loop and HTTP client kept for the life of each worker thread (one per
+# prefork child, one per thread in the realtime threads pool), so async agent
+# code doesn't rebuild the loop and reconnect to Graph/ClickUp on every task
+_worker_local = threading.local()
 
 
-def get_flask_app():
+def create_flask_app():
     """Create Flask app instance for Celery tasks."""
     from flask import Flask
     from flask_login import LoginManager
     from models import db, User
     from config import config
+    from utils.cache import cache
     
     config_name = os.getenv('FLASK_ENV', 'production')
     
@@ -63,6 +111,7 @@ def get_flask_app():
     app.config.from_object(config[config_name])
     
     db.init_app(app)
+    cache.init_app(app)
     
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -71,39 +120,88 @@ def get_flask_app():
     def load_user(user_id):
         return db.session.get(User, int(user_id))
     
-    with app.app_context():
-        db.create_all()
-    
     return app
 
 
+def get_flask_app():
+    """Get this worker process's Flask app, creating it on first use."""
+    global _flask_app
+    if _flask_app is None:
+        with _flask_app_lock:
+            if _flask_app is None:
+                _flask_app = create_flask_app()
+    return _flask_app
+
+
+def get_event_loop():
+    """Get this worker thread's persistent event loop."""
+    loop = getattr(_worker_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = _worker_local.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop
+
+
+def get_http_client():
+    """Get this worker thread's shared async HTTP client (bound to its event loop)."""
+    import httpx
+    
+    client = getattr(_worker_local, 'http_client', None)
+    if client is None or client.is_closed:
+        client = _worker_local.http_client = httpx.AsyncClient(timeout=30.0)
+    return client
+
+
+def run_async(coro):
+    """Run a coroutine to completion on this worker thread's persistent loop."""
+    return get_event_loop().run_until_complete(coro)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Build the app and event loop in each prefork child at boot, before it takes any tasks."""
+    get_flask_app()
+    get_event_loop()
+
+
+def get_ready_user_ids(config_model):
+    """
+    Get ids of users whose agent config (config_model) is enabled and who have
+    a ClickUp list, a Microsoft token and a ClickUp API key - in one query.
+    """
+    from models import db, User, UserSettings
+    
+    rows = db.session.query(User.id)\
+        .join(UserSettings, UserSettings.user_id == User.id)\
+        .join(config_model, config_model.user_id == User.id)\
+        .filter(
+            config_model.is_enabled.is_(True),
+            config_model.clickup_list_id.isnot(None),
+            config_model.clickup_list_id != '',
+            UserSettings._ms_access_token.isnot(None),
+            UserSettings._clickup_api_key.isnot(None)
+        ).all()
+    
+    return [user_id for (user_id,) in rows]
+
+
 @celery.task(bind=True)
 def scan_all_users_meetings(self):
     """Scan meetings for all enabled users."""
-    from models import db, MeetingAgentConfig
+    from models import MeetingAgentConfig
     
     app = get_flask_app()
     with app.app_context():
-        # Get all users with enabled meeting agent
-        enabled_configs = MeetingAgentConfig.query.filter_by(is_enabled=True).all()
+        user_ids = get_ready_user_ids(MeetingAgentConfig)
         
-        results = []
-        for config in enabled_configs:
-            user = config.user
-            
-            # Check if user has required settings
-            if not user.settings or not user.settings.ms_access_token:
-                continue
-            if not config.clickup_list_id:
-                continue
-            if not user.settings.clickup_api_key:
-                continue
-            
-            # Queue individual user scan
-            scan_user_meetings.delay(user.id)
-            results.append(f"Queued meeting scan for user {user.id}")
+        # Queue all user scans in one broker submission
+        if user_ids:
+            group(scan_user_meetings.s(user_id) for user_id in user_ids).apply_async()
         
-        return {'users_queued': len(results), 'details': results}
+        return {
+            'users_queued': len(user_ids),
+            'details': [f"Queued meeting scan for user {user_id}" for user_id in user_ids]
+        }
 
 
 @celery.task(bind=True, max_retries=3)
@@ -111,17 +209,18 @@ def scan_user_meetings(self, user_id):
     """Scan meetings for a specific user."""
     from models import db, User, ActivityLog
     from agents.meeting_agent.service import MeetingAgentService
-    import asyncio
     
     app = get_flask_app()
     with app.app_context():
-        user = db.session.get(User, user_id)
+        # Settings and agent config come back in the same LEFT JOIN row (both uselist=False)
+        user = db.session.get(User, user_id, options=[joinedload(User.settings), joinedload(User.meeting_config)])
         if not user:
             return {'error': 'User not found'}
         
         try:
             service = MeetingAgentService(user)
-            result = asyncio.run(service.process_meetings())
+            # Processed-item rows stay pending and commit with the activity log below
+            result = run_async(service.process_meetings(commit=False))
             
             # Log activity
             log = ActivityLog(
@@ -137,7 +236,8 @@ def scan_user_meetings(self, user_id):
             return result
             
         except Exception as e:
-            # Log error
+            # A failed flush leaves the session unusable - roll back before logging the error
+            db.session.rollback()
             log = ActivityLog(
                 user_id=user.id,
                 agent_type='meeting',
@@ -148,6 +248,11 @@ def scan_user_meetings(self, user_id):
             db.session.add(log)
             db.session.commit()
             
+            # A conflicting processed row means another run owns those items and
+            # their ClickUp tasks already exist - retrying would duplicate them
+            if isinstance(e, IntegrityError):
+                return {'error': str(e)}
+            
             # Retry on failure
             raise self.retry(exc=e, countdown=60)
 
@@ -155,30 +260,20 @@ def scan_user_meetings(self, user_id):
 @celery.task(bind=True)
 def scan_all_users_emails(self):
     """Scan emails for all enabled users."""
-    from models import db, EmailAgentConfig
+    from models import EmailAgentConfig
     
     app = get_flask_app()
     with app.app_context():
-        # Get all users with enabled email agent
-        enabled_configs = EmailAgentConfig.query.filter_by(is_enabled=True).all()
+        user_ids = get_ready_user_ids(EmailAgentConfig)
         
-        results = []
-        for config in enabled_configs:
-            user = config.user
-            
-            # Check if user has required settings
-            if not user.settings or not user.settings.ms_access_token:
-                continue
-            if not config.clickup_list_id:
-                continue
-            if not user.settings.clickup_api_key:
-                continue
-            
-            # Queue individual user scan
-            scan_user_emails.delay(user.id)
-            results.append(f"Queued email scan for user {user.id}")
+        # Queue all user scans in one broker submission
+        if user_ids:
+            group(scan_user_emails.s(user_id) for user_id in user_ids).apply_async()
         
-        return {'users_queued': len(results), 'details': results}
+        return {
+            'users_queued': len(user_ids),
+            'details': [f"Queued email scan for user {user_id}" for user_id in user_ids]
+        }
 
 
 @celery.task(bind=True, max_retries=3)
@@ -186,17 +281,18 @@ def scan_user_emails(self, user_id):
     """Scan emails for a specific user."""
     from models import db, User, ActivityLog
     from agents.email_agent.service import EmailAgentService
-    import asyncio
     
     app = get_flask_app()
     with app.app_context():
-        user = db.session.get(User, user_id)
+        # Settings and agent config come back in the same LEFT JOIN row (both uselist=False)
+        user = db.session.get(User, user_id, options=[joinedload(User.settings), joinedload(User.email_config)])
         if not user:
             return {'error': 'User not found'}
         
         try:
-            service = EmailAgentService(user)
-            result = asyncio.run(service.process_emails())
+            service = EmailAgentService(user, http_client=get_http_client())
+            # Processed-item rows stay pending and commit with the activity log below
+            result = run_async(service.process_emails(commit=False))
             
             # Log activity
             log = ActivityLog(
@@ -212,7 +308,8 @@ def scan_user_emails(self, user_id):
             return result
             
         except Exception as e:
-            # Log error
+            # A failed flush leaves the session unusable - roll back before logging the error
+            db.session.rollback()
             log = ActivityLog(
                 user_id=user.id,
                 agent_type='email',
@@ -223,41 +320,118 @@ def scan_user_emails(self, user_id):
             db.session.add(log)
             db.session.commit()
             
+            # A conflicting processed row means another run owns those items and
+            # their ClickUp tasks already exist - retrying would duplicate them
+            if isinstance(e, IntegrityError):
+                return {'error': str(e)}
+            
             # Retry on failure
             raise self.retry(exc=e, countdown=60)
 
 
-# Task triggered by webhook when new email arrives
-@celery.task(bind=True)
-def process_new_email_notification(self, user_id, email_id):
-    """Process a single incoming email (triggered by webhook)."""
+# Webhook notifications are coalesced per user: each notification adds its
+# email id to a Redis sorted set, and the first pending one schedules a flush a
+# couple of seconds later that hands everything collected for that user to one
+# batch, so a burst of messages costs one task (one app context, token refresh
+# and ClickUp/Graph session) instead of N. Nothing runs while nothing is pending.
+PENDING_EMAILS_KEY = 'pending_emails:{user_id}'
+PENDING_EMAIL_USERS_KEY = 'pending_emails:users'  # Users with a flush scheduled
+EMAIL_FLUSH_DELAY = 2  # Seconds to collect a burst before processing it
+REALTIME_TASK_TIMEOUT = 120  # task_time_limit isn't enforced by the threads pool
+
+_redis_client = None
+
+
+def get_redis():
+    """Get the shared Redis client used for webhook coalescing."""
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True
+        )
+    return _redis_client
+
+
+def queue_email_notification(user_id, email_id):
+    """Record a webhook email notification, scheduling a flush if none is pending."""
+    pipe = get_redis().pipeline()
+    pipe.zadd(PENDING_EMAILS_KEY.format(user_id=user_id), {email_id: time.time()})
+    pipe.sadd(PENDING_EMAIL_USERS_KEY, user_id)
+    _, newly_pending = pipe.execute()
+    
+    if newly_pending:
+        flush_user_email_notifications.apply_async((user_id,), countdown=EMAIL_FLUSH_DELAY)
+
+
+@celery.task(bind=True, ignore_result=True)
+def flush_user_email_notifications(self, user_id):
+    """Process every webhook notification collected for a user as one batch."""
+    r = get_redis()
+    key = PENDING_EMAILS_KEY.format(user_id=user_id)
+    
+    # Take and clear the user's pending ids atomically; anything arriving
+    # afterwards finds the user unmarked and schedules the next flush
+    pipe = r.pipeline()
+    pipe.srem(PENDING_EMAIL_USERS_KEY, user_id)
+    pipe.zrange(key, 0, -1)
+    pipe.delete(key)
+    _, email_ids, _ = pipe.execute()
+    
+    if email_ids:
+        process_user_email_batch(int(user_id), email_ids)
+
+
+@celery.task(bind=True, queue='realtime')
+def process_user_email_batch(self, user_id, email_ids):
+    """Process a batch of incoming emails for one user (coalesced webhook notifications)."""
     from models import db, User, ActivityLog
     from agents.email_agent.service import EmailAgentService
-    import asyncio
     
     app = get_flask_app()
     with app.app_context():
-        user = db.session.get(User, user_id)
+        # Settings and agent config come back in the same LEFT JOIN row (both uselist=False)
+        user = db.session.get(User, user_id, options=[joinedload(User.settings), joinedload(User.email_config)])
         if not user:
             return {'error': 'User not found'}
         
         try:
-            service = EmailAgentService(user)
-            # Process just this specific email
-            result = asyncio.run(service.process_single_email(email_id))
+            service = EmailAgentService(user, http_client=get_http_client())
+            # Processed-email rows stay pending and commit with the activity log below
+            result = run_async(asyncio.wait_for(
+                service.process_emails(commit=False, email_ids=email_ids), REALTIME_TASK_TIMEOUT
+            ))
             
-            if result.get('processed'):
+            if result['success'] and result['emails_checked']:
                 log = ActivityLog(
                     user_id=user.id,
                     agent_type='email',
                     action='webhook_scan',
-                    message=f"Real-time: Processed email, created {result.get('tasks_created', 0)} tasks",
+                    message=f"Real-time: Processed {result['emails_checked']} emails, created {result['tasks_created']} tasks",
                     status='success'
                 )
                 db.session.add(log)
-                db.session.commit()
+            db.session.commit()
             
             return result
             
+        except asyncio.TimeoutError:
+            # Keep the emails finished before the timeout - their ClickUp tasks exist
+            db.session.commit()
+            return {'error': f'Timed out after {REALTIME_TASK_TIMEOUT}s'}
+            
         except Exception as e:
+            db.session.rollback()
             return {'error': str(e)}
+
+
+# Task triggered by webhook when new email arrives
+@celery.task(bind=True, queue='realtime')
+def process_new_email_notification(self, user_id, email_id):
+    """Process a single incoming email right away (prefer queue_email_notification)."""
+    return process_user_email_batch(user_id, [email_id])
+
+
+# Import ATS tasks to register them with Celery (at the end, since they import
+# celery and get_flask_app from this module)
+import agents.ats_agent.tasks  # noqa: E402, F401
@@ -15,11 +15,26 @@ class Config:
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool - tune per deployment (web workers + Celery share the DB)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),  # Recycle before server idle timeouts
+        'pool_pre_ping': True,  # Detect dead connections before use
+    }
+    
     # Redis for Celery
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
     
+    # Cache (Flask-Caching) - shares the Redis instance with Celery
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'RedisCache')
+    CACHE_REDIS_URL = REDIS_URL
+    CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 60))
+    CACHE_KEY_PREFIX = 'unified_app:'
+    
     # OpenAI (default app-level key, users can override)
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
     
@@ -48,6 +63,9 @@ class Config:
     CLICKUP_API = "https://api.clickup.com/api/v2"
     CLICKUP_API_V3 = "https://api.clickup.com/api/v3"
     
+    # Logging (DEBUG enables verbose scan/fetch tracing)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    
     # Background job intervals (in seconds)
     MEETING_SCAN_INTERVAL = 30 * 60  # 30 minutes
     EMAIL_SCAN_INTERVAL = 5 * 60     # 5 minutes (polling fallback)
@@ -3,39 +3,97 @@ Database Models for Unified AI Agents Application
 """
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import os
+import re
+import base64
 import json
+import functools
 
 db = SQLAlchemy()
 
+# Argon2id password hashing (C implementation, unlike werkzeug's pure-Python pbkdf2)
+password_hasher = PasswordHasher()
 
-def get_cipher():
-    """Get Fernet cipher for encryption/decryption."""
+# JSON list columns: native JSONB on PostgreSQL (parsed by the driver), JSON elsewhere
+JSONList = db.JSON().with_variant(JSONB, 'postgresql')
+
+
+def json_list(value):
+    """
+    Normalize a JSONList column value to a list. Columns not yet converted by
+    scripts/migrate_json_columns.py are still TEXT and come back as JSON strings.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+# Prefix marking AES-GCM ciphertexts; values without it are legacy Fernet tokens
+GCM_PREFIX = 'gcm1:'
+
+
+@functools.lru_cache(maxsize=1)
+def get_encryption_key():
+    """Get the Fernet-format ENCRYPTION_KEY (resolved once per process)."""
     key = os.getenv('ENCRYPTION_KEY', '')
     if not key:
         # Generate a key for development (not secure for production)
         key = Fernet.generate_key().decode()
-    return Fernet(key.encode() if isinstance(key, str) else key)
+    return key.encode() if isinstance(key, str) else key
+
+
+@functools.lru_cache(maxsize=1)
+def get_cipher():
+    """Get Fernet cipher for decrypting legacy values (built once per process)."""
+    return Fernet(get_encryption_key())
+
+
+@functools.lru_cache(maxsize=1)
+def get_aead():
+    """Get AES-256-GCM cipher for encryption/decryption (built once per process)."""
+    # Derive a separate key so the same secret isn't used directly by two algorithms
+    key = HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b'unified_app aes-gcm'
+    ).derive(base64.urlsafe_b64decode(get_encryption_key()))
+    return AESGCM(key)
+
+
+def is_legacy_encrypted(encrypted_value):
+    """True if the value was encrypted with Fernet rather than AES-GCM."""
+    return bool(encrypted_value) and not encrypted_value.startswith(GCM_PREFIX)
 
 
 def encrypt_value(value):
     """Encrypt a string value."""
     if not value:
         return None
-    cipher = get_cipher()
-    return cipher.encrypt(value.encode()).decode()
+    nonce = os.urandom(12)
+    ciphertext = get_aead().encrypt(nonce, value.encode(), None)
+    return GCM_PREFIX + base64.b64encode(nonce + ciphertext).decode()
 
 
 def decrypt_value(encrypted_value):
-    """Decrypt an encrypted string value."""
+    """Decrypt an encrypted string value (AES-GCM, or legacy Fernet)."""
     if not encrypted_value:
         return None
     try:
-        cipher = get_cipher()
-        return cipher.decrypt(encrypted_value.encode()).decode()
+        if is_legacy_encrypted(encrypted_value):
+            return get_cipher().decrypt(encrypted_value.encode()).decode()
+        data = base64.b64decode(encrypted_value[len(GCM_PREFIX):])
+        return get_aead().decrypt(data[:12], data[12:], None).decode()
     except Exception:
         return None
 
@@ -62,10 +120,24 @@ class User(UserMixin, db.Model):
     cv_candidates = db.relationship('CVCandidate', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Accounts created before the switch to argon2 still have werkzeug hashes;
+        # verify those the old way and upgrade them (the login route commits)
+        if not self.password_hash.startswith('$argon2'):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def __repr__(self):
         return f'<User {self.email}>'
@@ -93,37 +165,68 @@ class UserSettings(db.Model):
     
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Scheduled dispatchers: only users with both Microsoft and ClickUp credentials
+        db.Index('idx_settings_ready', 'user_id',
+                 postgresql_where=db.and_(_ms_access_token.isnot(None), _clickup_api_key.isnot(None)),
+                 sqlite_where=db.and_(_ms_access_token.isnot(None), _clickup_api_key.isnot(None))),
+    )
+    
+    def _get_decrypted(self, column_attr):
+        """Decrypt an encrypted column once per loaded instance."""
+        cache = self.__dict__.setdefault('_decrypted_cache', {})
+        if column_attr not in cache:
+            encrypted_value = getattr(self, column_attr)
+            value = decrypt_value(encrypted_value)
+            if value and is_legacy_encrypted(encrypted_value):
+                # Re-encrypt legacy Fernet values; saved with the next commit
+                setattr(self, column_attr, encrypt_value(value))
+            cache[column_attr] = value
+        return cache[column_attr]
+    
+    def _set_encrypted(self, column_attr, value):
+        """Encrypt a value into a column and drop its cached plaintext."""
+        setattr(self, column_attr, encrypt_value(value))
+        self.__dict__.get('_decrypted_cache', {}).pop(column_attr, None)
+    
     @property
     def clickup_api_key(self):
-        return decrypt_value(self._clickup_api_key)
+        return self._get_decrypted('_clickup_api_key')
     
     @clickup_api_key.setter
     def clickup_api_key(self, value):
-        self._clickup_api_key = encrypt_value(value)
+        self._set_encrypted('_clickup_api_key', value)
     
     @property
     def openai_api_key(self):
-        return decrypt_value(self._openai_api_key)
+        return self._get_decrypted('_openai_api_key')
     
     @openai_api_key.setter
     def openai_api_key(self, value):
-        self._openai_api_key = encrypt_value(value)
+        self._set_encrypted('_openai_api_key', value)
     
     @property
     def ms_access_token(self):
-        return decrypt_value(self._ms_access_token)
+        return self._get_decrypted('_ms_access_token')
     
     @ms_access_token.setter
     def ms_access_token(self, value):
-        self._ms_access_token = encrypt_value(value)
+        self._set_encrypted('_ms_access_token', value)
     
     @property
     def ms_refresh_token(self):
-        return decrypt_value(self._ms_refresh_token)
+        return self._get_decrypted('_ms_refresh_token')
     
     @ms_refresh_token.setter
     def ms_refresh_token(self, value):
-        self._ms_refresh_token = encrypt_value(value)
+        self._set_encrypted('_ms_refresh_token', value)
+
+
+@event.listens_for(UserSettings, 'expire')
+@event.listens_for(UserSettings, 'refresh')
+def _clear_decrypted_cache(target, *args):
+    """Drop cached plaintext when the row is expired or reloaded from the DB."""
+    target.__dict__.pop('_decrypted_cache', None)
 
 
 class EmailAgentConfig(db.Model):
@@ -136,12 +239,12 @@ class EmailAgentConfig(db.Model):
     # ClickUp settings
     clickup_list_id = db.Column(db.String(50), nullable=True)
     
-    # Filters (stored as JSON)
-    _allowed_senders = db.Column('allowed_senders', db.Text, default='[]')
-    _allowed_assignees = db.Column('allowed_assignees', db.Text, default='[]')
-    _sensitive_keywords = db.Column('sensitive_keywords', db.Text, default='[]')
-    _ignore_subject_prefixes = db.Column('ignore_subject_prefixes', db.Text, 
-                                         default='["Automatic reply:", "Accepted:", "Declined:", "Tentative:", "Canceled:"]')
+    # Filters (stored as JSON lists)
+    _allowed_senders = db.Column('allowed_senders', JSONList, default=list)
+    _allowed_assignees = db.Column('allowed_assignees', JSONList, default=list)
+    _sensitive_keywords = db.Column('sensitive_keywords', JSONList, default=list)
+    _ignore_subject_prefixes = db.Column('ignore_subject_prefixes', JSONList,
+                                         default=lambda: ["Automatic reply:", "Accepted:", "Declined:", "Tentative:", "Canceled:"])
     
     # Agent settings
     is_enabled = db.Column(db.Boolean, default=True)
@@ -152,35 +255,58 @@ class EmailAgentConfig(db.Model):
     
     @property
     def allowed_senders(self):
-        return json.loads(self._allowed_senders or '[]')
+        return json_list(self._allowed_senders)
     
     @allowed_senders.setter
     def allowed_senders(self, value):
-        self._allowed_senders = json.dumps(value if isinstance(value, list) else [])
+        self._allowed_senders = value if isinstance(value, list) else []
+        self.__dict__.pop('allowed_senders_set', None)
+    
+    @functools.cached_property
+    def allowed_senders_set(self):
+        """Lowercased allowed senders for O(1) membership checks per email."""
+        return frozenset(s.lower() for s in self.allowed_senders)
     
     @property
     def allowed_assignees(self):
-        return json.loads(self._allowed_assignees or '[]')
+        return json_list(self._allowed_assignees)
     
     @allowed_assignees.setter
     def allowed_assignees(self, value):
-        self._allowed_assignees = json.dumps(value if isinstance(value, list) else [])
+        self._allowed_assignees = value if isinstance(value, list) else []
     
     @property
     def sensitive_keywords(self):
-        return json.loads(self._sensitive_keywords or '[]')
+        return json_list(self._sensitive_keywords)
     
     @sensitive_keywords.setter
     def sensitive_keywords(self, value):
-        self._sensitive_keywords = json.dumps(value if isinstance(value, list) else [])
+        self._sensitive_keywords = value if isinstance(value, list) else []
     
     @property
     def ignore_subject_prefixes(self):
-        return json.loads(self._ignore_subject_prefixes or '[]')
+        return json_list(self._ignore_subject_prefixes)
     
     @ignore_subject_prefixes.setter
     def ignore_subject_prefixes(self, value):
-        self._ignore_subject_prefixes = json.dumps(value if isinstance(value, list) else [])
+        self._ignore_subject_prefixes = value if isinstance(value, list) else []
+        self.__dict__.pop('ignore_subject_re', None)
+    
+    @functools.cached_property
+    def ignore_subject_re(self):
+        """All ignore prefixes compiled into one anchored regex (None if there are none)."""
+        prefixes = self.ignore_subject_prefixes
+        if not prefixes:
+            return None
+        return re.compile('(?:' + '|'.join(map(re.escape, prefixes)) + ')')
+
+
+@event.listens_for(EmailAgentConfig, 'expire')
+@event.listens_for(EmailAgentConfig, 'refresh')
+def _clear_filter_cache(target, *args):
+    """Drop cached filter matchers when the row is expired or reloaded from the DB."""
+    target.__dict__.pop('allowed_senders_set', None)
+    target.__dict__.pop('ignore_subject_re', None)
 
 
 class MeetingAgentConfig(db.Model):
@@ -198,11 +324,11 @@ class MeetingAgentConfig(db.Model):
     # Email alerts
     helpdesk_email = db.Column(db.String(120), nullable=True)
     
-    # Meeting filters (stored as JSON)
-    _meeting_name_filters = db.Column('meeting_name_filters', db.Text, default='[]')
-    _standup_meeting_keywords = db.Column('standup_meeting_keywords', db.Text, 
-                                          default='["Daily Standup", "Stand-up", "Standup"]')
-    _excluded_meeting_names = db.Column('excluded_meeting_names', db.Text, default='[]')
+    # Meeting filters (stored as JSON lists)
+    _meeting_name_filters = db.Column('meeting_name_filters', JSONList, default=list)
+    _standup_meeting_keywords = db.Column('standup_meeting_keywords', JSONList,
+                                          default=lambda: ["Daily Standup", "Stand-up", "Standup"])
+    _excluded_meeting_names = db.Column('excluded_meeting_names', JSONList, default=list)
     
     # Agent settings
     is_enabled = db.Column(db.Boolean, default=True)
@@ -214,27 +340,27 @@ class MeetingAgentConfig(db.Model):
     
     @property
     def meeting_name_filters(self):
-        return json.loads(self._meeting_name_filters or '[]')
+        return json_list(self._meeting_name_filters)
     
     @meeting_name_filters.setter
     def meeting_name_filters(self, value):
-        self._meeting_name_filters = json.dumps(value if isinstance(value, list) else [])
+        self._meeting_name_filters = value if isinstance(value, list) else []
     
     @property
     def standup_meeting_keywords(self):
-        return json.loads(self._standup_meeting_keywords or '[]')
+        return json_list(self._standup_meeting_keywords)
     
     @standup_meeting_keywords.setter
     def standup_meeting_keywords(self, value):
-        self._standup_meeting_keywords = json.dumps(value if isinstance(value, list) else [])
+        self._standup_meeting_keywords = value if isinstance(value, list) else []
     
     @property
     def excluded_meeting_names(self):
-        return json.loads(self._excluded_meeting_names or '[]')
+        return json_list(self._excluded_meeting_names)
     
     @excluded_meeting_names.setter
     def excluded_meeting_names(self, value):
-        self._excluded_meeting_names = json.dumps(value if isinstance(value, list) else [])
+        self._excluded_meeting_names = value if isinstance(value, list) else []
 
 
 class BotConfig(db.Model):
@@ -246,9 +372,9 @@ class BotConfig(db.Model):
     
     # Bot personality
     bot_name = db.Column(db.String(50), default='Brian')
-    _wake_words = db.Column('wake_words', db.Text, default='["hello Brian", "hey Brian", "Brian"]')
-    _dismissal_phrases = db.Column('dismissal_phrases', db.Text, 
-                                   default='["that\'s all", "thanks Brian", "goodbye", "bye"]')
+    _wake_words = db.Column('wake_words', JSONList, default=lambda: ["hello Brian", "hey Brian", "Brian"])
+    _dismissal_phrases = db.Column('dismissal_phrases', JSONList,
+                                   default=lambda: ["that's all", "thanks Brian", "goodbye", "bye"])
     
     # ClickUp context
     clickup_space_name = db.Column(db.String(100), default='AI Context')
@@ -263,19 +389,19 @@ class BotConfig(db.Model):
     
     @property
     def wake_words(self):
-        return json.loads(self._wake_words or '[]')
+        return json_list(self._wake_words)
     
     @wake_words.setter
     def wake_words(self, value):
-        self._wake_words = json.dumps(value if isinstance(value, list) else [])
+        self._wake_words = value if isinstance(value, list) else []
     
     @property
     def dismissal_phrases(self):
-        return json.loads(self._dismissal_phrases or '[]')
+        return json_list(self._dismissal_phrases)
     
     @dismissal_phrases.setter
     def dismissal_phrases(self, value):
-        self._dismissal_phrases = json.dumps(value if isinstance(value, list) else [])
+        self._dismissal_phrases = value if isinstance(value, list) else []
 
 
 class ProcessedEmail(db.Model):
@@ -291,7 +417,10 @@ class ProcessedEmail(db.Model):
     processed_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (
+        # Its unique index also serves the dedup lookups by (user_id, email_id)
         db.UniqueConstraint('user_id', 'email_id', name='unique_user_email'),
+        # Dashboard / history listings: WHERE user_id ORDER BY processed_at DESC
+        db.Index('idx_processed_emails_user_time', 'user_id', processed_at.desc()),
     )
 
 
@@ -308,7 +437,10 @@ class ProcessedMeeting(db.Model):
     processed_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (
+        # Its unique index also serves the dedup lookups by (user_id, transcript_id)
         db.UniqueConstraint('user_id', 'transcript_id', name='unique_user_transcript'),
+        # Dashboard / history listings: WHERE user_id ORDER BY processed_at DESC
+        db.Index('idx_processed_meetings_user_time', 'user_id', processed_at.desc()),
     )
 
 
@@ -422,26 +554,27 @@ class CVCandidate(db.Model):
     current_job_title = db.Column(db.String(255), nullable=True)
     
     # CV Data
-    cv_text = db.Column(db.Text, nullable=True)  # Full extracted text
+    cv_text = db.deferred(db.Column(db.Text, nullable=True), group='detail')  # Full extracted text
     cv_file_path = db.Column(db.String(500), nullable=True)  # Stored file location
     cv_source = db.Column(db.String(50), nullable=True)  # 'google_drive', 'sharepoint', 'outlook', 'email'
     source_file_id = db.Column(db.String(500), nullable=True)  # Original file ID from source (Microsoft Graph IDs can be 380+ chars)
     source_file_name = db.Column(db.String(255), nullable=True)
     
-    # Scoring Results
+    # Scoring Results (large text columns are deferred - list views never need them;
+    # load with undefer_group('detail') when showing a single candidate)
     status = db.Column(db.String(50), default='pending')  # 'pending', 'scored', 'filtered_out', 'rejected'
     skills_score = db.Column(db.Integer, nullable=True)
-    skills_reasoning = db.Column(db.Text, nullable=True)
+    skills_reasoning = db.deferred(db.Column(db.Text, nullable=True), group='detail')
     title_score = db.Column(db.Integer, nullable=True)
-    title_reasoning = db.Column(db.Text, nullable=True)
+    title_reasoning = db.deferred(db.Column(db.Text, nullable=True), group='detail')
     experience_score = db.Column(db.Integer, nullable=True)
-    experience_reasoning = db.Column(db.Text, nullable=True)
+    experience_reasoning = db.deferred(db.Column(db.Text, nullable=True), group='detail')
     education_score = db.Column(db.Integer, nullable=True)
-    education_reasoning = db.Column(db.Text, nullable=True)
+    education_reasoning = db.deferred(db.Column(db.Text, nullable=True), group='detail')
     keywords_score = db.Column(db.Integer, nullable=True)
-    keywords_reasoning = db.Column(db.Text, nullable=True)
+    keywords_reasoning = db.deferred(db.Column(db.Text, nullable=True), group='detail')
     final_weighted_score = db.Column(db.Numeric(5, 2), nullable=True)
-    overall_assessment = db.Column(db.Text, nullable=True)
+    overall_assessment = db.deferred(db.Column(db.Text, nullable=True), group='detail')
     _red_flags = db.Column('red_flags', db.Text, default='[]')
     
     # Metadata
@@ -450,6 +583,8 @@ class CVCandidate(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'source_file_id', name='unique_user_cv'),
+        # Top-N / results listing: WHERE user_id, status ORDER BY score DESC
+        db.Index('ix_cvc_user_status_score', 'user_id', 'status', final_weighted_score.desc()),
     )
     
     @property
@@ -487,4 +622,9 @@ class ATSScanHistory(db.Model):
     status = db.Column(db.String(50), default='running')  # 'running', 'completed', 'failed'
     error_message = db.Column(db.Text, nullable=True)
     
+    __table_args__ = (
+        # Recent scans / history: WHERE user_id ORDER BY scan_started_at DESC
+        db.Index('ix_scan_user_started', 'user_id', 'scan_started_at'),
+    )
+    
     user = db.relationship('User', backref=db.backref('ats_scan_history', lazy='dynamic'))
@@ -0,0 +1,35 @@
+"""
+Database Index Migration Script
+Creates any indexes declared on the models that are missing from an existing
+database (db.create_all() only creates indexes for brand new tables)
+"""
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db
+
+def add_indexes():
+    """Create missing indexes for all model tables."""
+    app = create_app()
+    
+    with app.app_context():
+        print("Starting index migration...")
+        
+        try:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=db.engine, checkfirst=True)
+                    print(f"✅ {table.name}: {index.name}")
+            
+            print("✅ Index migration completed successfully!")
+            
+        except Exception as e:
+            print(f"❌ Error during index migration: {e}")
+            raise
+
+if __name__ == '__main__':
+    add_indexes()
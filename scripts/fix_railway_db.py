@@ -37,62 +37,38 @@ def fix_column_sizes():
                 print("✅ All tables recreated with correct schema!")
                 return
             
-            # For PostgreSQL, check and alter column if needed
+            # For PostgreSQL, check and alter the column in one statement (single
+            # round trip, and no window between the check and the ALTER).
+            # Missing tables are created by scripts/migrate_db.py.
             if is_postgres:
-                # Check if table exists
-                check_sql = """
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.tables 
-                    WHERE table_name = 'cv_candidates'
-                );
+                fix_sql = """
+                DO $$
+                BEGIN
+                    IF EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'cv_candidates'
+                        AND column_name = 'source_file_id'
+                        AND character_maximum_length <> 500
+                    ) THEN
+                        ALTER TABLE cv_candidates ALTER COLUMN source_file_id TYPE VARCHAR(500);
+                    END IF;
+                END $$;
                 """
-                result = db.session.execute(db.text(check_sql))
-                table_exists = result.scalar()
-                
-                if not table_exists:
-                    print("⚠️  Table 'cv_candidates' doesn't exist yet.")
-                    print("Running db.create_all() first...")
-                    db.create_all()
-                    print("✅ Tables created!")
-                    return
-                
-                # Check current column size
-                check_column_sql = """
-                SELECT column_name, character_maximum_length 
-                FROM information_schema.columns 
-                WHERE table_name = 'cv_candidates' 
-                AND column_name = 'source_file_id';
-                """
-                result = db.session.execute(db.text(check_column_sql))
-                row = result.fetchone()
-                
-                if row:
-                    current_length = row[1]
-                    print(f"Current source_file_id length: {current_length}")
-                    
-                    if current_length == 500:
-                        print("✅ Column is already the correct size (500)!")
-                        return
-                    
-                    # Alter the column
-                    print("Altering source_file_id column to VARCHAR(500)...")
-                    alter_sql = """
-                    ALTER TABLE cv_candidates 
-                    ALTER COLUMN source_file_id TYPE VARCHAR(500);
-                    """
-                    db.session.execute(db.text(alter_sql))
-                    db.session.commit()
-                    
-                    # Verify the change
-                    result = db.session.execute(db.text(check_column_sql))
-                    row = result.fetchone()
-                    new_length = row[1]
-                    
-                    print(f"✅ Column altered successfully! New length: {new_length}")
+                db.session.execute(db.text(fix_sql))
+
+                # Report the result in the same transaction (the DO block is a
+                # no-op when the table or column doesn't exist)
+                length = db.session.execute(db.text("""
+                SELECT character_maximum_length FROM information_schema.columns
+                WHERE table_name = 'cv_candidates' AND column_name = 'source_file_id';
+                """)).scalar()
+                db.session.commit()
+
+                if length is None:
+                    print("⚠️  Table 'cv_candidates' or column 'source_file_id' not found.")
+                    print("Run scripts/migrate_db.py first to create missing tables.")
                 else:
-                    print("⚠️  Column 'source_file_id' not found. Creating table...")
-                    db.create_all()
-                    print("✅ Tables created!")
+                    print(f"✅ source_file_id column is VARCHAR({length})!")
             
         except Exception as e:
             print(f"❌ Error during column fix: {e}")
@@ -0,0 +1,62 @@
+"""
+JSON Column Migration Script
+Converts the agent config list columns from TEXT to native JSONB on PostgreSQL
+so rows are parsed by the driver instead of json.loads on every access
+"""
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db
+
+JSON_COLUMNS = {
+    'email_agent_configs': [
+        'allowed_senders', 'allowed_assignees', 'sensitive_keywords', 'ignore_subject_prefixes'
+    ],
+    'meeting_agent_configs': [
+        'meeting_name_filters', 'standup_meeting_keywords', 'excluded_meeting_names'
+    ],
+    'bot_configs': ['wake_words', 'dismissal_phrases'],
+}
+
+def migrate_json_columns():
+    """Convert TEXT list columns to JSONB (PostgreSQL only, safe to re-run)."""
+    app = create_app()
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("⚠️  Not PostgreSQL, JSON columns need no migration.")
+            return
+
+        print("Starting JSON column migration...")
+
+        try:
+            for table, columns in JSON_COLUMNS.items():
+                for column in columns:
+                    data_type = db.session.execute(db.text("""
+                        SELECT data_type FROM information_schema.columns
+                        WHERE table_name = :table AND column_name = :column
+                    """), {'table': table, 'column': column}).scalar()
+
+                    if data_type is None or data_type == 'jsonb':
+                        continue
+
+                    db.session.execute(db.text(
+                        f"ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT, "
+                        f"ALTER COLUMN {column} TYPE JSONB USING COALESCE(NULLIF({column}, ''), '[]')::jsonb"
+                    ))
+                    print(f"✅ {table}.{column}: {data_type} -> jsonb")
+
+            db.session.commit()
+            print("✅ JSON column migration completed successfully!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error during JSON column migration: {e}")
+            raise
+
+if __name__ == '__main__':
+    migrate_json_columns()
@@ -0,0 +1,7 @@
+"""
+Application Cache
+Shared Flask-Caching instance (Redis-backed in production)
+"""
+from flask_caching import Cache
+
+cache = Cache()
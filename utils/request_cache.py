@@ -0,0 +1,30 @@
+"""
+Per-request Lookups
+Memoizes the current user's config rows on flask.g for the life of a request
+"""
+from flask import g
+from flask_login import current_user
+from models import db, ATSAgentConfig, UserSettings
+
+
+def get_ats_config(create=False):
+    """
+    Get the current user's ATS config, loaded at most once per request.
+    If create is True, a default config is created when none exists.
+    """
+    if 'ats_config' not in g:
+        g.ats_config = ATSAgentConfig.query.filter_by(user_id=current_user.id).first()
+    
+    if g.ats_config is None and create:
+        g.ats_config = ATSAgentConfig(user_id=current_user.id)
+        db.session.add(g.ats_config)
+        db.session.commit()
+    
+    return g.ats_config
+
+
+def get_user_settings():
+    """Get the current user's settings, loaded at most once per request."""
+    if 'user_settings' not in g:
+        g.user_settings = UserSettings.query.filter_by(user_id=current_user.id).first()
+    return g.user_settings